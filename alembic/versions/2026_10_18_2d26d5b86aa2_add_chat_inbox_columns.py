@@ -0,0 +1,48 @@
+"""add chat inbox columns
+
+Revision ID: 2d26d5b86aa2
+Revises: d08e392f6f05
+Create Date: 2026-10-18 05:37:35.600385
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d26d5b86aa2'
+down_revision: Union[str, None] = 'd08e392f6f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chats", sa.Column("last_message_id", sa.Integer(), nullable=True))
+    op.add_column("chats", sa.Column("last_activity", sa.DateTime(), nullable=True))
+    op.execute(
+        """
+        UPDATE chats SET
+            last_message_id = latest.id,
+            last_activity = latest.timestamp
+        FROM (
+            SELECT DISTINCT ON (chat_id) chat_id, id, timestamp
+            FROM messages
+            ORDER BY chat_id, id DESC
+        ) AS latest
+        WHERE latest.chat_id = chats.id
+        """
+    )
+    op.execute("UPDATE chats SET last_activity = now() WHERE last_activity IS NULL")
+    op.alter_column("chats", "last_activity", nullable=False)
+
+    op.create_index("ix_group_participants_user_id", "group_participants", ["user_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_group_participants_user_id", table_name="group_participants")
+    op.drop_column("chats", "last_activity")
+    op.drop_column("chats", "last_message_id")
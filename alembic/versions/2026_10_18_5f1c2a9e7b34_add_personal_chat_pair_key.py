@@ -0,0 +1,56 @@
+"""add personal chat pair key
+
+Revision ID: 5f1c2a9e7b34
+Revises: 2d26d5b86aa2
+Create Date: 2026-10-18 06:12:48.214907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2a9e7b34'
+down_revision: Union[str, None] = '2d26d5b86aa2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chats", sa.Column("user_low_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True))
+    op.add_column("chats", sa.Column("user_high_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True))
+    # Ключ получает только самый старый личный чат каждой пары, чтобы
+    # существующие дубликаты не мешали созданию уникального индекса.
+    op.execute(
+        """
+        UPDATE chats SET
+            user_low_id = pairs.user_low_id,
+            user_high_id = pairs.user_high_id
+        FROM (
+            SELECT DISTINCT ON (user_low_id, user_high_id) chat_id, user_low_id, user_high_id
+            FROM (
+                SELECT chats.id AS chat_id,
+                       min(group_participants.user_id) AS user_low_id,
+                       max(group_participants.user_id) AS user_high_id
+                FROM chats
+                JOIN group_participants ON group_participants.group_id = chats.id
+                WHERE chats.type = 'PERSONAL'
+                GROUP BY chats.id
+                HAVING count(*) <= 2
+            ) AS personal
+            ORDER BY user_low_id, user_high_id, chat_id
+        ) AS pairs
+        WHERE pairs.chat_id = chats.id
+        """
+    )
+    op.create_index("uq_chats_personal_pair", "chats", ["user_low_id", "user_high_id"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("uq_chats_personal_pair", table_name="chats")
+    op.drop_column("chats", "user_high_id")
+    op.drop_column("chats", "user_low_id")
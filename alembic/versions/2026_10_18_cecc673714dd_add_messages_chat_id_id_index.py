@@ -0,0 +1,33 @@
+"""add messages chat id id index
+
+Revision ID: cecc673714dd
+Revises: 256524abc6be
+Create Date: 2026-10-18 05:35:24.309912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cecc673714dd'
+down_revision: Union[str, None] = '256524abc6be'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в messages, но не работает внутри транзакции.
+    with op.get_context().autocommit_block():
+        op.create_index("ix_messages_chat_id_id", "messages", ["chat_id", "id"], postgresql_concurrently=True)
+        op.drop_index("ix_messages_chat_id", table_name="messages", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index("ix_messages_chat_id", "messages", ["chat_id"], postgresql_concurrently=True)
+        op.drop_index("ix_messages_chat_id_id", table_name="messages", postgresql_concurrently=True)
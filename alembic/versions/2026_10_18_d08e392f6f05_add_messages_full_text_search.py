@@ -0,0 +1,75 @@
+"""add messages full text search
+
+Revision ID: d08e392f6f05
+Revises: cecc673714dd
+Create Date: 2026-10-18 05:36:21.698673
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd08e392f6f05'
+down_revision: Union[str, None] = 'cecc673714dd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Обычная nullable-колонка добавляется без перезаписи таблицы, в отличие
+    # от STORED generated column. Новые строки заполняет триггер, старые —
+    # пакетный backfill, каждый пакет в своей транзакции.
+    op.add_column("messages", sa.Column("text_tsv", postgresql.TSVECTOR(), nullable=True))
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION messages_text_tsv_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.text_tsv := to_tsvector('simple', NEW.text);
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER messages_text_tsv_update
+        BEFORE INSERT OR UPDATE OF text ON messages
+        FOR EACH ROW EXECUTE FUNCTION messages_text_tsv_update()
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        if context.is_offline_mode():
+            op.execute("UPDATE messages SET text_tsv = to_tsvector('simple', text) WHERE text_tsv IS NULL")
+        else:
+            bind = op.get_bind()
+            max_id = bind.execute(sa.text("SELECT max(id) FROM messages")).scalar() or 0
+            for start in range(0, max_id, BACKFILL_BATCH_SIZE):
+                bind.execute(
+                    sa.text(
+                        "UPDATE messages SET text_tsv = to_tsvector('simple', text) "
+                        "WHERE id > :start AND id <= :end AND text_tsv IS NULL"
+                    ),
+                    {"start": start, "end": start + BACKFILL_BATCH_SIZE},
+                )
+        op.create_index(
+            "ix_messages_text_tsv", "messages", ["text_tsv"],
+            postgresql_using="gin", postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_messages_text_tsv", table_name="messages", postgresql_concurrently=True)
+    op.execute("DROP TRIGGER messages_text_tsv_update ON messages")
+    op.execute("DROP FUNCTION messages_text_tsv_update()")
+    op.drop_column("messages", "text_tsv")
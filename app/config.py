@@ -1,15 +1,65 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.exc import DBAPIError
+from app.db_pool import InstrumentedQueuePool
+import ipaddress
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "False").lower() == "true"
+# 0 отключает кэш подготовленных выражений (нужно за PgBouncer в режиме transaction).
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
 
-engine = create_async_engine(DATABASE_URL, echo=os.getenv("SQLALCHEMY_ECHO", "False").lower() == "true")
+# Прокси (IP или CIDR через запятую, "*" — любой), которым доверяется
+# X-Forwarded-For. То же значение uvicorn читает для --forwarded-allow-ips.
+FORWARDED_ALLOW_IPS = [
+    host.strip() for host in os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1").split(",") if host.strip()
+]
+TRUSTED_PROXY_NETWORKS = [
+    ipaddress.ip_network(host, strict=False) for host in FORWARDED_ALLOW_IPS if host != "*"
+]
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=os.getenv("SQLALCHEMY_ECHO", "False").lower() == "true",
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 async def get_db():
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def is_statement_error(error: Exception) -> bool:
+    """
+    True, если БД отвергла сам запрос (данные, ограничения), а не потеряно
+    соединение: такой запрос бессмысленно повторять без изменений.
+    """
+    return isinstance(error, DBAPIError) and not error.connection_invalidated
+
+
+def is_trusted_proxy(host: str) -> bool:
+    if "*" in FORWARDED_ALLOW_IPS:
+        return True
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXY_NETWORKS)
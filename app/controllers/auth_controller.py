@@ -1,14 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Cookie
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.user_service import UserService
-from app.services.redis_service import RedisService
 from app.services.csrf_service import CSRFService
+from app.services.token_cache import token_cache
+from app.services.rate_limiter import rate_limiter, LOGIN_IP_RULE, LOGIN_ACCOUNT_RULE, REGISTER_IP_RULE
 from app.schemas.user import UserCreate, UserResponse
-from app.config import get_db
-from jose import jwt, JWTError
+from app.config import get_db, is_trusted_proxy
+from jose import jwt
 from datetime import datetime, timedelta
 import os
+import uuid
 import logging
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
@@ -22,7 +24,8 @@ COOKIE_SAMESITE = os.getenv("COOKIE_SAMESITE", "lax")
 
 
 @router.post("/register", response_model=UserResponse)
-async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+async def register_user(request: Request, user_data: UserCreate, db: AsyncSession = Depends(get_db)):
+    await rate_limiter.hit(REGISTER_IP_RULE, client_ip(request))
     user_service = UserService(db)
     logger.info(f"Registering user with email: {user_data.email}")
     try:
@@ -36,16 +39,23 @@ async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db
 
 @router.post("/token")
 async def login_for_access_token(
+        request: Request,
         response: Response,
         form_data: OAuth2PasswordRequestForm = Depends(),
         db: AsyncSession = Depends(get_db)
 ):
-    user_service = UserService(db)
     logger.info(f"Login attempt for user: {form_data.username}")
+    account = form_data.username.strip().lower()
+    # Лимиты проверяются до bcrypt: отклонённая попытка не нагружает хэширование.
+    await rate_limiter.hit(LOGIN_IP_RULE, client_ip(request))
+    await rate_limiter.hit(LOGIN_ACCOUNT_RULE, account)
+
+    user_service = UserService(db)
     user = await user_service.authenticate_user(form_data.username, form_data.password)
     if not user:
         logger.warning(f"Failed login attempt for user: {form_data.username}")
         raise HTTPException(status_code=401, detail="Incorrect email or password")
+    await rate_limiter.reset(LOGIN_ACCOUNT_RULE, account)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -83,8 +93,11 @@ async def refresh_access_token(
     user_service = UserService(db)
     logger.info("Refresh token request")
     try:
-        refresh_token_obj = await user_service.get_refresh_token(refresh_token)
-        user = await user_service.get_user_by_id(refresh_token_obj.user_id)
+        user_id, new_refresh_token = await user_service.rotate_refresh_token(refresh_token)
+        user = await user_service.get_principal(user_id)
+        if user is None:
+            logger.warning(f"Refresh token belongs to missing user: {user_id}")
+            raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
             data={"sub": str(user.id), "role": user.role.value},
@@ -102,6 +115,7 @@ async def refresh_access_token(
         csrf_token = csrf_service.generate_csrf_token(str(user.id))
         logger.debug(f"Access token refreshed for user: {user.id}")
         return {
+            "refresh_token": new_refresh_token,
             "token_type": "bearer",
             "csrf_token": csrf_token
         }
@@ -112,33 +126,22 @@ async def refresh_access_token(
 
 @router.post("/logout")
 async def logout(
+        request: Request,
         response: Response,
-        access_token: str = Cookie(None),
         refresh_token: str = None,
-        csrf_token: str = Depends(lambda x: x.headers.get("X-CSRF-Token")),
         db: AsyncSession = Depends(get_db)
 ):
     logger.info("Logout request")
-    if not access_token:
+    # AuthMiddleware уже проверил access-токен, его отзыв и CSRF-токен.
+    auth = getattr(request.state, "auth", None)
+    if auth is None:
         logger.warning("Logout attempt without access token")
         raise HTTPException(status_code=401, detail="Not authenticated")
+    access_token, payload = auth
+    user_id = payload.get("sub")
 
-    try:
-        payload = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        csrf_service = CSRFService()
-        if not csrf_service.verify_csrf_token(user_id, csrf_token):
-            logger.warning(f"Invalid CSRF token for user: {user_id}")
-            raise HTTPException(status_code=403, detail="Invalid CSRF token")
-    except JWTError:
-        logger.error("Invalid access token during logout")
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    from app.main import redis_pool
-    redis_service = RedisService(redis_pool)
-    if access_token:
-        await redis_service.add_to_blacklist(access_token, ACCESS_TOKEN_EXPIRE_MINUTES)
-        logger.debug(f"Access token blacklisted for user: {user_id}")
+    await token_cache.revoke(access_token, payload, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    logger.debug(f"Access token blacklisted for user: {user_id}")
 
     if refresh_token:
         user_service = UserService(db)
@@ -153,9 +156,54 @@ async def logout(
     return {"message": "Logged out successfully"}
 
 
+@router.post("/logout/all")
+async def logout_all_sessions(
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info("Logout from all sessions request")
+    auth = getattr(request.state, "auth", None)
+    if auth is None:
+        logger.warning("Logout attempt without access token")
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    access_token, payload = auth
+    user_id = int(payload.get("sub"))
+
+    await token_cache.revoke(access_token, payload, ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+    user_service = UserService(db)
+    revoked = await user_service.revoke_all_refresh_tokens(user_id)
+    response.delete_cookie(key="access_token")
+    logger.info(f"User {user_id} logged out from all sessions, {revoked} refresh tokens revoked")
+    return {"message": "Logged out from all sessions"}
+
+
+def client_ip(request: Request) -> str:
+    """
+    Адрес клиента для лимитов по IP. X-Forwarded-For учитывается, только если
+    запрос пришёл от доверенного прокси: адрес клиента — первый справа узел
+    цепочки, не входящий в FORWARDED_ALLOW_IPS.
+    """
+    if not request.client:
+        return "unknown"
+    host = request.client.host
+    if not is_trusted_proxy(host):
+        return host
+    forwarded = [
+        address.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for address in header.split(",")
+        if address.strip()
+    ]
+    for address in reversed(forwarded):
+        if not is_trusted_proxy(address):
+            return address
+    return forwarded[0] if forwarded else host
+
+
 def create_access_token(data: dict, expires_delta: timedelta):
     to_encode = data.copy()
     expire = datetime.utcnow() + expires_delta
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -1,20 +1,33 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.chat_service import ChatService
-from app.services.message_service import MessageService
 from app.services.group_service import GroupService
-from app.schemas.chat import ChatCreate, ChatResponse
-from app.schemas.message import MessageCreate, MessageResponse
+from app.services.websocket_service import WebSocketService, websocket_invalid_frames_total
+from app.services.connection_manager import connection_manager, CLOSE_TRY_AGAIN_LATER
+from app.services.admission_controller import admission_controller
+from app.schemas.chat import ChatCreate, ChatResponse, InboxPage, ParticipantsUpdate, ParticipantsResult
 from app.config import get_db
-from app.main import get_current_user, CurrentUser
-from typing import Dict, List
+from app.main import get_current_user, authenticate_token, CurrentUser
+from typing import Optional
 import json
 import logging
 
 router = APIRouter(prefix="/chats", tags=["Chats"])
-websocket_connections: Dict[int, List[WebSocket]] = {}
 logger = logging.getLogger(__name__)
 
+@router.get("/", response_model=InboxPage)
+async def get_inbox(
+        limit: int = Query(50, ge=1, le=100),
+        cursor: Optional[str] = None,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Fetching inbox for user: {current_user.id}")
+    chat_service = ChatService(db)
+    page = await chat_service.get_inbox(current_user.id, limit=limit, cursor=cursor)
+    logger.debug(f"Retrieved {len(page.items)} chats for user: {current_user.id}")
+    return page
+
 @router.post("/", response_model=ChatResponse)
 async def create_personal_chat(
         user1_id: int,
@@ -77,16 +90,56 @@ async def remove_group_participant(
         logger.error(f"Failed to remove user from group: {str(e.detail)}")
         raise
 
+@router.post("/group/{group_id}/participants/bulk-add", response_model=ParticipantsResult)
+async def add_group_participants(
+        group_id: int,
+        participants: ParticipantsUpdate,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Adding {len(participants.user_ids)} users to group {group_id}")
+    group_service = GroupService(db)
+    try:
+        result = await group_service.add_participants(group_id, participants.user_ids, current_user.id)
+        logger.debug(f"Bulk add to group {group_id} finished")
+        return result
+    except HTTPException as e:
+        logger.error(f"Failed to add users to group: {str(e.detail)}")
+        raise
+
+@router.post("/group/{group_id}/participants/bulk-remove", response_model=ParticipantsResult)
+async def remove_group_participants(
+        group_id: int,
+        participants: ParticipantsUpdate,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Removing {len(participants.user_ids)} users from group {group_id}")
+    group_service = GroupService(db)
+    try:
+        result = await group_service.remove_participants(group_id, participants.user_ids, current_user.id)
+        logger.debug(f"Bulk remove from group {group_id} finished")
+        return result
+    except HTTPException as e:
+        logger.error(f"Failed to remove users from group: {str(e.detail)}")
+        raise
+
 @router.websocket("/{chat_id}")
 async def websocket_endpoint(
         websocket: WebSocket,
         chat_id: int,
         token: str,
+        last_seen_id: Optional[str] = None,
         db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"WebSocket connection attempt for chat: {chat_id}")
+    if admission_controller.reject_reason(connection_manager.connection_count):
+        # Сокет принимается, чтобы клиент получил код 1013 и повторил попытку позже.
+        await websocket.accept()
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Server overloaded")
+        return
     try:
-        current_user = await get_current_user(token=token, db=db)
+        current_user = await authenticate_token(token, db)
     except HTTPException:
         logger.warning("Invalid token for WebSocket connection")
         await websocket.close(code=1008, reason="Invalid token")
@@ -95,20 +148,15 @@ async def websocket_endpoint(
     await websocket.accept()
     logger.debug(f"WebSocket connected for user: {current_user.id}, chat: {chat_id}")
 
-    chat_service = ChatService(db)
-    chat = await chat_service.get_chat_by_id(chat_id)
-    if not chat:
-        logger.warning(f"Chat not found: {chat_id}")
-        await websocket.close(code=1008, reason="Chat not found")
-        return
-    if not await chat_service.chat_repo.is_participant(chat_id, current_user.id):
-        logger.warning(f"User {current_user.id} not in chat: {chat_id}")
-        await websocket.close(code=1008, reason="User not in chat")
+    websocket_service = WebSocketService(db)
+    try:
+        await websocket_service.authorize_chat(chat_id, current_user.id)
+    except HTTPException as e:
+        logger.warning(f"User {current_user.id} cannot join chat {chat_id}: {str(e.detail)}")
+        await websocket.close(code=1008, reason=str(e.detail))
         return
 
-    if chat_id not in websocket_connections:
-        websocket_connections[chat_id] = []
-    websocket_connections[chat_id].append(websocket)
+    connection = await connection_manager.connect(chat_id, websocket, current_user.id, last_seen_id)
 
     try:
         while True:
@@ -116,56 +164,14 @@ async def websocket_endpoint(
             try:
                 message_data = json.loads(data)
             except json.JSONDecodeError:
+                websocket_invalid_frames_total.labels(reason="json").inc()
                 logger.error("Invalid JSON in WebSocket message")
-                await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+                connection.send_json({"type": "error", "detail": "Invalid JSON"})
                 continue
 
-            if message_data.get("type") == "message":
-                logger.info(f"New message in chat {chat_id} from user {current_user.id}")
-                message_service = MessageService(db)
-                message = MessageCreate(
-                    chat_id=chat_id,
-                    text=message_data.get("text", "")
-                )
-                message_uuid = message_data.get("uuid")
-                if not message_uuid:
-                    logger.warning("Message UUID missing")
-                    await websocket.send_json({"type": "error", "detail": "UUID required"})
-                    continue
-                try:
-                    saved_message = await message_service.send_message(message, current_user.id, message_uuid)
-                    logger.debug(f"Message sent: {saved_message.id}")
-                    for ws in websocket_connections.get(chat_id, []):
-                        await ws.send_json({
-                            "type": "message",
-                            "message": MessageResponse.model_validate(saved_message).model_dump()
-                        })
-                except HTTPException as e:
-                    logger.error(f"Failed to send message: {str(e.detail)}")
-                    await websocket.send_json({"type": "error", "detail": str(e.detail)})
-
-            elif message_data.get("type") == "read":
-                logger.info(f"Marking message as read in chat {chat_id}")
-                message_service = MessageService(db)
-                message_id = message_data.get("message_id")
-                if not message_id:
-                    logger.warning("Message ID missing for read action")
-                    await websocket.send_json({"type": "error", "detail": "Message ID required"})
-                    continue
-                try:
-                    await message_service.mark_message_as_read(message_id, current_user.id)
-                    logger.debug(f"Message {message_id} marked as read")
-                    for ws in websocket_connections.get(chat_id, []):
-                        await ws.send_json({
-                            "type": "read",
-                            "message_id": message_id
-                        })
-                except HTTPException as e:
-                    logger.error(f"Failed to mark message as read: {str(e.detail)}")
-                    await websocket.send_json({"type": "error", "detail": str(e.detail)})
+            await websocket_service.handle_frame(connection, chat_id, current_user.id, message_data)
 
     except WebSocketDisconnect:
-        websocket_connections[chat_id].remove(websocket)
-        if not websocket_connections[chat_id]:
-            del websocket_connections[chat_id]
-        logger.info(f"WebSocket disconnected for chat: {chat_id}")
\ No newline at end of file
+        logger.info(f"WebSocket disconnected for chat: {chat_id}")
+    finally:
+        await connection_manager.disconnect(connection)
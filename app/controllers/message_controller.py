@@ -1,19 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.message_service import MessageService
-from app.schemas.message import MessageResponse
-from app.config import get_db
+from app.schemas.message import MessagePage
+from app.config import get_db, async_session
 from app.main import get_current_user, CurrentUser
-from typing import List
+from typing import Optional
 import logging
 
 router = APIRouter(prefix="/history", tags=["Messages"])
 logger = logging.getLogger(__name__)
 
 
-@router.get("/{chat_id}", response_model=List[MessageResponse])
+@router.get("/{chat_id}", response_model=MessagePage)
 async def get_chat_history(
         chat_id: int,
+        limit: int = Query(50, ge=1, le=200),
+        before: Optional[str] = None,
+        after: Optional[str] = None,
         current_user: CurrentUser = Depends(get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
@@ -25,6 +29,33 @@ async def get_chat_history(
         raise HTTPException(status_code=403, detail="Not authorized to view this chat")
 
     message_service = MessageService(db)
-    messages = await message_service.get_chat_history(chat_id)
-    logger.debug(f"Retrieved {len(messages)} messages for chat: {chat_id}")
-    return [MessageResponse.model_validate(msg) for msg in messages]
\ No newline at end of file
+    page = await message_service.get_chat_history(chat_id, limit=limit, before=before, after=after)
+    logger.debug(f"Retrieved {len(page.items)} messages for chat: {chat_id}")
+    return page
+
+
+
+@router.get("/{chat_id}/export")
+async def export_chat_history(
+        chat_id: int,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Exporting history for chat: {chat_id}")
+    from app.services.chat_service import ChatService
+    chat_service = ChatService(db)
+    if not await chat_service.chat_repo.is_participant(chat_id, current_user.id):
+        logger.warning(f"User {current_user.id} not authorized to export chat: {chat_id}")
+        raise HTTPException(status_code=403, detail="Not authorized to view this chat")
+
+    async def export_lines():
+        async with async_session() as session:
+            async for chunk in MessageService(session).export_chat_history(chat_id):
+                yield chunk
+        logger.debug(f"Export finished for chat: {chat_id}")
+
+    return StreamingResponse(
+        export_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat_{chat_id}.ndjson"'}
+    )
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.message_service import MessageService
+from app.schemas.message import MessageSearchPage
+from app.config import get_db
+from app.main import get_current_user, CurrentUser
+from typing import Optional
+import logging
+
+router = APIRouter(prefix="/search", tags=["Search"])
+logger = logging.getLogger(__name__)
+
+
+@router.get("/", response_model=MessageSearchPage)
+async def search_messages(
+        q: str = Query(..., min_length=1, max_length=200),
+        chat_id: Optional[int] = None,
+        limit: int = Query(20, ge=1, le=50),
+        cursor: Optional[str] = None,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info(f"Searching messages for user: {current_user.id}")
+    message_service = MessageService(db)
+    page = await message_service.search_messages(current_user.id, q, limit=limit, chat_id=chat_id, cursor=cursor)
+    logger.debug(f"Found {len(page.items)} messages for user: {current_user.id}")
+    return page
@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.websocket_service import WebSocketService, websocket_invalid_frames_total
+from app.services.connection_manager import connection_manager, CLOSE_TRY_AGAIN_LATER
+from app.services.admission_controller import admission_controller
+from app.config import get_db
+from app.main import authenticate_token
+import json
+import logging
+
+router = APIRouter(tags=["WebSocket"])
+logger = logging.getLogger(__name__)
+
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(
+        websocket: WebSocket,
+        token: str,
+        db: AsyncSession = Depends(get_db)
+):
+    logger.info("Multiplexed WebSocket connection attempt")
+    if admission_controller.reject_reason(connection_manager.connection_count):
+        # Сокет принимается, чтобы клиент получил код 1013 и повторил попытку позже.
+        await websocket.accept()
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Server overloaded")
+        return
+    try:
+        current_user = await authenticate_token(token, db)
+    except HTTPException:
+        logger.warning("Invalid token for WebSocket connection")
+        await websocket.close(code=1008, reason="Invalid token")
+        return
+
+    await websocket.accept()
+    logger.debug(f"Multiplexed WebSocket connected for user: {current_user.id}")
+
+    websocket_service = WebSocketService(db)
+    connection = connection_manager.register(websocket, current_user.id)
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message_data = json.loads(data)
+            except json.JSONDecodeError:
+                websocket_invalid_frames_total.labels(reason="json").inc()
+                logger.error("Invalid JSON in WebSocket message")
+                connection.send_json({"type": "error", "detail": "Invalid JSON"})
+                continue
+            if not isinstance(message_data, dict):
+                websocket_invalid_frames_total.labels(reason="frame").inc()
+                logger.warning("WebSocket frame is not a JSON object")
+                connection.send_json({"type": "error", "detail": "Invalid frame"})
+                continue
+
+            frame_type = message_data.get("type")
+            try:
+                chat_id = int(message_data.get("chat_id"))
+            except (TypeError, ValueError, OverflowError):
+                logger.warning(f"Chat ID missing for frame: {frame_type}")
+                connection.send_json({"type": "error", "detail": "Chat ID required"})
+                continue
+
+            if frame_type == "subscribe":
+                if chat_id in connection.chat_ids:
+                    connection.send_json({"type": "subscribed", "chat_id": chat_id})
+                    continue
+                try:
+                    await websocket_service.authorize_chat(chat_id, current_user.id)
+                except HTTPException as e:
+                    logger.warning(f"User {current_user.id} cannot subscribe to chat {chat_id}: {str(e.detail)}")
+                    connection.send_json({"type": "error", "chat_id": chat_id, "detail": str(e.detail)})
+                    continue
+                last_seen_id = message_data.get("last_seen_id")
+                await connection_manager.subscribe(
+                    connection, chat_id, str(last_seen_id) if last_seen_id is not None else None
+                )
+                logger.debug(f"User {current_user.id} subscribed to chat: {chat_id}")
+                connection.send_json({"type": "subscribed", "chat_id": chat_id})
+
+            elif frame_type == "unsubscribe":
+                await connection_manager.unsubscribe(connection, chat_id)
+                logger.debug(f"User {current_user.id} unsubscribed from chat: {chat_id}")
+                connection.send_json({"type": "unsubscribed", "chat_id": chat_id})
+
+            else:
+                await websocket_service.handle_frame(connection, chat_id, current_user.id, message_data)
+
+    except WebSocketDisconnect:
+        logger.info(f"Multiplexed WebSocket disconnected for user: {current_user.id}")
+    finally:
+        await connection_manager.disconnect(connection)
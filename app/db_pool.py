@@ -0,0 +1,39 @@
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from prometheus_client import Counter, Gauge, Histogram
+import time
+
+db_pool_size = Gauge('db_pool_size', 'Configured number of persistent connections in the database pool')
+db_pool_checked_out = Gauge('db_pool_checked_out', 'Database connections currently checked out of the pool')
+db_pool_overflow = Gauge('db_pool_overflow', 'Database connections open above the pool size')
+db_pool_wait_seconds = Histogram(
+    'db_pool_wait_seconds', 'Time spent acquiring a connection from the database pool',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+db_pool_timeouts_total = Counter(
+    'db_pool_timeouts_total', 'Database connection checkouts that timed out because the pool was exhausted'
+)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений SQLAlchemy, экспортирующий в Prometheus число выданных
+    соединений, overflow и время ожидания соединения. Гаужи читают состояние
+    пула при сборе метрик, поэтому всегда показывают последний созданный пул.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        db_pool_size.set(self.size())
+        db_pool_checked_out.set_function(self.checkedout)
+        db_pool_overflow.set_function(lambda: max(0, self.overflow()))
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            db_pool_timeouts_total.inc()
+            raise
+        finally:
+            db_pool_wait_seconds.observe(time.perf_counter() - started_at)
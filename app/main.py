@@ -1,13 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, Cookie
+from fastapi import FastAPI, Depends, HTTPException, Cookie, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import get_db
 from app.controllers.chat_controller import router as chat_router
 from app.controllers.message_controller import router as message_router
 from app.controllers.auth_controller import router as auth_router
+from app.controllers.websocket_controller import router as websocket_router
+from app.controllers.search_controller import router as search_router
 from app.services.redis_service import RedisService
-from app.middlewares.csrf_middleware import csrf_middleware
+from app.services.connection_manager import connection_manager
+from app.services.membership_cache import membership_cache
+from app.services.token_cache import token_cache
+from app.services.principal_cache import principal_cache
+from app.services.read_receipt_service import read_receipt_buffer
+from app.services.message_ingest import message_ingest_pipeline
+from app.services.password_hasher import password_hasher
+from app.services.refresh_token_store import refresh_token_store
+from app.services.rate_limiter import rate_limiter
+from app.services.frame_limiter import frame_rate_limiter
+from app.services.admission_controller import admission_controller
+from app.middlewares.auth_middleware import AuthMiddleware, verify_access_token
 from app.logging_config import setup_logging
-from jose import JWTError, jwt
 from app.schemas.user import UserRole
 from prometheus_fastapi_instrumentator import Instrumentator
 import redis.asyncio as redis
@@ -26,11 +38,13 @@ app = FastAPI(
 
 Instrumentator().instrument(app).expose(app)
 
-app.middleware("http")(csrf_middleware)
+app.add_middleware(AuthMiddleware)
 
 app.include_router(chat_router)
 app.include_router(message_router)
 app.include_router(auth_router)
+app.include_router(websocket_router)
+app.include_router(search_router)
 
 redis_pool: redis.ConnectionPool = None
 logger = logging.getLogger(__name__)
@@ -42,51 +56,60 @@ class CurrentUser(NamedTuple):
 
 
 async def get_current_user(
+        request: Request,
         access_token: Optional[str] = Cookie(None),
         token: Optional[str] = None,
         db: AsyncSession = Depends(get_db)
 ):
-    from app.services.user_service import UserService
-
-    SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
-    ALGORITHM = "HS256"
-
     selected_token = access_token or token
     if selected_token is None:
         logger.warning("Authentication attempt without token")
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    redis_service = RedisService(redis_pool)
-    if await redis_service.is_blacklisted(selected_token):
-        logger.warning(f"Attempt to use blacklisted token: {selected_token[:10]}...")
-        raise HTTPException(status_code=401, detail="Token has been revoked")
-
-    try:
-        payload = jwt.decode(selected_token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        role: str = payload.get("role")
-        if user_id is None or role is None:
-            logger.warning("Invalid token payload")
-            raise HTTPException(status_code=401, detail="Invalid token")
-        if role not in [UserRole.USER, UserRole.ADMIN]:
-            logger.warning(f"Invalid role in token: {role}")
-            raise HTTPException(status_code=401, detail="Invalid role")
-        user_service = UserService(db)
-        user = await user_service.get_user_by_id(int(user_id))
-        if user is None:
-            logger.warning(f"User not found for ID: {user_id}")
-            raise HTTPException(status_code=401, detail="User not found")
-        logger.debug(f"Authenticated user: {user_id}, role: {role}")
-        return CurrentUser(id=user.id, role=UserRole(role))
-    except JWTError as e:
-        logger.error(f"JWT decode error: {str(e)}")
+    auth = getattr(request.state, "auth", None)
+    claims = auth.claims if auth is not None and auth.token == selected_token else None
+    return await authenticate_token(selected_token, db, claims)
+
+
+async def authenticate_token(token: str, db: AsyncSession, claims: Optional[dict] = None) -> CurrentUser:
+    """
+    Возвращает пользователя по токену. Если AuthMiddleware уже проверил
+    токен, его claims передаются сюда, и повторная проверка не выполняется.
+    """
+    from app.services.user_service import UserService
+
+    payload = claims if claims is not None else verify_access_token(token)
+    user_id: str = payload.get("sub")
+    role: str = payload.get("role")
+    if user_id is None or role is None:
+        logger.warning("Invalid token payload")
         raise HTTPException(status_code=401, detail="Invalid token")
+    if role not in [UserRole.USER, UserRole.ADMIN]:
+        logger.warning(f"Invalid role in token: {role}")
+        raise HTTPException(status_code=401, detail="Invalid role")
+    user_service = UserService(db)
+    principal = await user_service.get_principal(int(user_id))
+    if principal is None:
+        logger.warning(f"User not found for ID: {user_id}")
+        raise HTTPException(status_code=401, detail="User not found")
+    logger.debug(f"Authenticated user: {user_id}, role: {principal.role}")
+    return CurrentUser(id=principal.id, role=principal.role)
 
 
 @app.on_event("startup")
 async def startup_event():
     global redis_pool
     redis_pool = RedisService.create_pool()
+    await membership_cache.start(redis_pool)
+    await token_cache.start(redis_pool)
+    await principal_cache.start(redis_pool)
+    await refresh_token_store.start(redis_pool)
+    await rate_limiter.start(redis_pool)
+    await frame_rate_limiter.start(redis_pool)
+    await admission_controller.start()
+    await connection_manager.start(redis_pool)
+    await read_receipt_buffer.start()
+    await message_ingest_pipeline.start()
     setup_logging()
     logger.info("Application started")
 
@@ -94,6 +117,17 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     global redis_pool
+    await message_ingest_pipeline.stop()
+    await read_receipt_buffer.stop()
+    await connection_manager.stop()
+    await membership_cache.stop()
+    await token_cache.stop()
+    await principal_cache.stop()
+    await refresh_token_store.stop()
+    await rate_limiter.stop()
+    await frame_rate_limiter.stop()
+    await admission_controller.stop()
+    password_hasher.shutdown()
     if redis_pool:
         await RedisService.close_pool(redis_pool)
         redis_pool = None
@@ -0,0 +1,87 @@
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.requests import cookie_parser
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.services.csrf_service import CSRFService
+from app.services.token_cache import token_cache
+from jose import JWTError
+from typing import NamedTuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS", "TRACE"}
+# У клиента на этих путях ещё нет access-токена и CSRF-токена.
+CSRF_EXEMPT_PATHS = {"/auth/register", "/auth/token", "/auth/refresh"}
+
+
+class AuthContext(NamedTuple):
+    token: str
+    claims: dict
+
+
+def verify_access_token(token: str) -> dict:
+    """
+    Проверяет подпись, срок действия и отзыв токена и возвращает его claims.
+    """
+    try:
+        claims = token_cache.decode(token)
+    except JWTError as e:
+        logger.error(f"JWT decode error: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if token_cache.is_revoked(token, claims):
+        logger.warning(f"Attempt to use blacklisted token: {token[:10]}...")
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+    return claims
+
+
+class AuthMiddleware:
+    """
+    ASGI-middleware: один раз на запрос проверяет access-токен из cookie и
+    кладёт AuthContext в request.state.auth, откуда его берёт get_current_user.
+    Для изменяющих запросов дополнительно проверяет CSRF-токен.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.csrf_service = CSRFService()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        access_token = cookie_parser(headers.get("cookie", "")).get("access_token")
+        requires_csrf = scope["method"] not in SAFE_METHODS and scope["path"] not in CSRF_EXEMPT_PATHS
+        try:
+            if access_token:
+                claims = verify_access_token(access_token)
+                scope.setdefault("state", {})["auth"] = AuthContext(token=access_token, claims=claims)
+            if requires_csrf:
+                self._check_csrf(access_token, headers.get("X-CSRF-Token"), scope)
+        except HTTPException as e:
+            if requires_csrf:
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+                await response(scope, receive, send)
+                return
+            # Для безопасных запросов ошибку вернёт get_current_user, если
+            # эндпоинт вообще требует аутентификации.
+        await self.app(scope, receive, send)
+
+    def _check_csrf(self, access_token: str, csrf_token: str, scope: Scope):
+        if not access_token:
+            logger.warning("No access token in request")
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if not csrf_token:
+            logger.warning("CSRF token missing")
+            raise HTTPException(status_code=403, detail="CSRF token missing")
+        user_id = scope["state"]["auth"].claims.get("sub")
+        if not user_id:
+            logger.warning("No user_id in token payload")
+            raise HTTPException(status_code=401, detail="Invalid token")
+        if not self.csrf_service.verify_csrf_token(user_id, csrf_token):
+            logger.warning(f"Invalid CSRF token for user: {user_id}")
+            raise HTTPException(status_code=403, detail="Invalid CSRF token")
+        logger.debug(f"CSRF check passed for user: {user_id}")
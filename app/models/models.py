@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Table, DateTime, Boolean
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Table, DateTime, Boolean, Index, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, declarative_base, deferred
 from sqlalchemy.ext.asyncio import AsyncSession
 from enum import Enum as PyEnum
 from datetime import datetime
@@ -21,7 +22,8 @@ group_participants = Table(
     "group_participants",
     Base.metadata,
     Column("group_id", Integer, ForeignKey("groups.id"), primary_key=True),
-    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True)
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Index("ix_group_participants_user_id", "user_id")
 )
 
 
@@ -29,9 +31,9 @@ group_participants = Table(
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     token = Column(String(512), unique=True, nullable=False)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     user = relationship("User", back_populates="refresh_tokens")
 
 
@@ -50,9 +52,16 @@ class User(Base):
 
 class Chat(Base):
     __tablename__ = "chats"
+    __table_args__ = (
+        Index("uq_chats_personal_pair", "user_low_id", "user_high_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), index=True, nullable=False)
     type = Column(Enum(ChatType), default=ChatType.PERSONAL, nullable=False)
+    user_low_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Только для личных чатов: min(user1, user2)
+    user_high_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Только для личных чатов: max(user1, user2)
+    last_message_id = Column(Integer, nullable=True)
+    last_activity = Column(DateTime, default=datetime.utcnow, nullable=False)
     messages = relationship("Message", back_populates="chat")
     group = relationship("Group", back_populates="chat", uselist=False)
 
@@ -70,12 +79,42 @@ class Group(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_id_id", "chat_id", "id"),
+        Index("ix_messages_text_tsv", "text_tsv", postgresql_using="gin"),
+    )
     id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, ForeignKey("chats.id"), index=True, nullable=False)
+    chat_id = Column(Integer, ForeignKey("chats.id"), nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     text = Column(String(2000), nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
     is_read = Column(Boolean, default=False, nullable=False)
     uuid = Column(String(36), unique=True, nullable=False)
+    # Заполняется триггером messages_text_tsv_update (см. миграцию d08e392f6f05).
+    text_tsv = deferred(Column(TSVECTOR, nullable=True))
     chat = relationship("Chat", back_populates="messages")
-    sender = relationship("User", back_populates="messages")
\ No newline at end of file
+    sender = relationship("User", back_populates="messages")
+
+
+# Тот же триггер, что создаёт миграция d08e392f6f05, — для схем из create_all.
+event.listen(Message.__table__, "after_create", DDL("""
+CREATE OR REPLACE FUNCTION messages_text_tsv_update() RETURNS trigger AS $$
+BEGIN
+    NEW.text_tsv := to_tsvector('simple', NEW.text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+""").execute_if(dialect="postgresql"))
+event.listen(Message.__table__, "after_create", DDL("""
+CREATE TRIGGER messages_text_tsv_update
+BEFORE INSERT OR UPDATE OF text ON messages
+FOR EACH ROW EXECUTE FUNCTION messages_text_tsv_update()
+""").execute_if(dialect="postgresql"))
+
+
+class ChatReadState(Base):
+    __tablename__ = "chat_read_states"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    chat_id = Column(Integer, ForeignKey("chats.id"), primary_key=True)
+    last_read_message_id = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,7 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from app.models.models import Chat, ChatType, group_participants
-from typing import Optional, List
+from sqlalchemy import select, func, update, or_, and_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+from app.models.models import Chat, ChatType, ChatReadState, Message, group_participants
+from app.services.membership_cache import membership_cache
+from datetime import datetime
+from typing import Dict, Optional, List, Set, Tuple
+
+PREVIEW_LENGTH = 200
+UNREAD_COUNT_LIMIT = 100
+
 
 class ChatRepository:
     def __init__(self, session: AsyncSession):
@@ -17,34 +25,138 @@ class ChatRepository:
         result = await self.session.execute(select(Chat).filter(Chat.id == chat_id))
         return result.scalars().first()
 
+    async def get_existing_ids(self, chat_ids: List[int]) -> Set[int]:
+        result = await self.session.execute(select(Chat.id).filter(Chat.id.in_(chat_ids)))
+        return set(result.scalars().all())
+
+    async def get_last_message_ids(self, chat_ids: List[int]) -> Dict[int, int]:
+        result = await self.session.execute(
+            select(Chat.id, Chat.last_message_id).filter(Chat.id.in_(chat_ids), Chat.last_message_id.is_not(None))
+        )
+        return {chat_id: last_message_id for chat_id, last_message_id in result.all()}
+
     async def add_participants(self, chat_id: int, user_ids: List[int]):
         chat = await self.get_by_id(chat_id)
         if not chat:
             raise ValueError("Chat not found")
-        for user_id in user_ids:
-            await self.session.execute(
-                "INSERT INTO group_participants (group_id, user_id) VALUES (:group_id, :user_id)",
-                {"group_id": chat_id, "user_id": user_id}
-            )
+        await self.session.execute(
+            insert(group_participants)
+            .values([{"group_id": chat_id, "user_id": user_id} for user_id in user_ids])
+            .on_conflict_do_nothing()
+        )
         await self.session.commit()
+        await membership_cache.add_members(chat_id, user_ids)
 
-    async def get_personal_chat(self, user1_id: int, user2_id: int) -> Optional[Chat]:
+    async def get_participant_ids(self, chat_id: int) -> List[int]:
+        result = await self.session.execute(
+            select(group_participants.c.user_id).filter(group_participants.c.group_id == chat_id)
+        )
+        return list(result.scalars().all())
 
+    async def get_personal_chat(self, user1_id: int, user2_id: int) -> Optional[Chat]:
+        user_low_id, user_high_id = sorted((user1_id, user2_id))
         result = await self.session.execute(
-            select(Chat)
-            .filter(Chat.type == ChatType.PERSONAL)
-            .join(group_participants, Chat.id == group_participants.c.group_id)
-            .filter(group_participants.c.user_id.in_([user1_id, user2_id]))
-            .group_by(Chat.id)
-            .having(func.count(group_participants.c.user_id) == 2)
+            select(Chat).filter(
+                Chat.user_low_id == user_low_id,
+                Chat.user_high_id == user_high_id
+            )
         )
         return result.scalars().first()
 
+    async def get_or_create_personal_chat(self, user1_id: int, user2_id: int, name: str) -> Tuple[Chat, bool]:
+        """
+        Создаёт личный чат по каноническому ключу (min, max) пары пользователей
+        одним INSERT ... ON CONFLICT DO NOTHING по уникальному индексу, вместе
+        с участниками в той же транзакции. Если чат уже есть, возвращает его.
+        """
+        user_low_id, user_high_id = sorted((user1_id, user2_id))
+        result = await self.session.scalars(
+            insert(Chat)
+            .values(
+                name=name,
+                type=ChatType.PERSONAL,
+                user_low_id=user_low_id,
+                user_high_id=user_high_id
+            )
+            .on_conflict_do_nothing(index_elements=[Chat.user_low_id, Chat.user_high_id])
+            .returning(Chat)
+        )
+        chat = result.first()
+        created = chat is not None
+        if created:
+            await self.session.execute(
+                insert(group_participants)
+                .values([
+                    {"group_id": chat.id, "user_id": user_id}
+                    for user_id in sorted({user_low_id, user_high_id})
+                ])
+                .on_conflict_do_nothing()
+            )
+        else:
+            chat = await self.get_personal_chat(user_low_id, user_high_id)
+        await self.session.commit()
+        if created:
+            await membership_cache.add_members(chat.id, {user_low_id, user_high_id})
+        return chat, created
+
     async def is_participant(self, chat_id: int, user_id: int) -> bool:
-        result = await self.session.execute(
-            select(group_participants).filter(
-                group_participants.c.group_id == chat_id,
-                group_participants.c.user_id == user_id
+        return await membership_cache.is_member(
+            chat_id, user_id, lambda: self.get_participant_ids(chat_id)
+        )
+
+    async def touch_last_message(self, chat_id: int, message_id: int, timestamp: datetime):
+        await self.session.execute(
+            update(Chat)
+            .where(
+                Chat.id == chat_id,
+                or_(Chat.last_message_id.is_(None), Chat.last_message_id < message_id)
             )
+            .values(last_message_id=message_id, last_activity=timestamp)
+        )
+
+    async def get_inbox(self, user_id: int, limit: int, before_activity: Optional[datetime] = None,
+                        before_id: Optional[int] = None) -> List[dict]:
+        """
+        Непрочитанные считаются по индексу (chat_id, id) как чужие сообщения
+        после watermark'а пользователя, не больше UNREAD_COUNT_LIMIT на чат.
+        """
+        unread_message = aliased(Message, name="unread_messages")
+        unread = (
+            select(unread_message.id)
+            .filter(
+                unread_message.chat_id == Chat.id,
+                unread_message.id > func.coalesce(ChatReadState.last_read_message_id, 0),
+                unread_message.sender_id != user_id
+            )
+            .correlate(Chat, ChatReadState)
+            .limit(UNREAD_COUNT_LIMIT)
+            .subquery("unread")
+        )
+        unread_count = select(func.count()).select_from(unread).scalar_subquery()
+        query = (
+            select(
+                Chat.id,
+                Chat.name,
+                Chat.type,
+                Chat.last_activity,
+                Message.id.label("last_message_id"),
+                Message.sender_id.label("last_message_sender_id"),
+                func.substr(Message.text, 1, PREVIEW_LENGTH).label("last_message_text"),
+                Message.timestamp.label("last_message_timestamp"),
+                unread_count.label("unread_count")
+            )
+            .select_from(group_participants)
+            .join(Chat, Chat.id == group_participants.c.group_id)
+            .outerjoin(Message, Message.id == Chat.last_message_id)
+            .outerjoin(
+                ChatReadState,
+                and_(ChatReadState.chat_id == Chat.id, ChatReadState.user_id == user_id)
+            )
+            .filter(group_participants.c.user_id == user_id)
+        )
+        if before_activity is not None:
+            query = query.filter(tuple_(Chat.last_activity, Chat.id) < tuple_(before_activity, before_id))
+        result = await self.session.execute(
+            query.order_by(Chat.last_activity.desc(), Chat.id.desc()).limit(limit)
         )
-        return bool(result.first())
\ No newline at end of file
+        return result.mappings().all()
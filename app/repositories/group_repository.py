@@ -1,7 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 from app.models.models import Group, group_participants
-from typing import Optional
+from app.services.membership_cache import membership_cache
+from typing import Optional, List, Set
 
 class GroupRepository:
     def __init__(self, session: AsyncSession):
@@ -19,23 +21,68 @@ class GroupRepository:
 
     async def add_participant(self, group_id: int, user_id: int):
         await self.session.execute(
-            "INSERT INTO group_participants (group_id, user_id) VALUES (:group_id, :user_id)",
-            {"group_id": group_id, "user_id": user_id}
+            insert(group_participants)
+            .values(group_id=group_id, user_id=user_id)
+            .on_conflict_do_nothing()
         )
         await self.session.commit()
+        await membership_cache.add_members(group_id, [user_id])
 
     async def remove_participant(self, group_id: int, user_id: int):
         await self.session.execute(
-            "DELETE FROM group_participants WHERE group_id = :group_id AND user_id = :user_id",
-            {"group_id": group_id, "user_id": user_id}
+            delete(group_participants).where(
+                group_participants.c.group_id == group_id,
+                group_participants.c.user_id == user_id
+            )
         )
         await self.session.commit()
+        await membership_cache.remove_members(group_id, [user_id])
 
-    async def is_participant(self, group_id: int, user_id: int) -> bool:
+    async def add_participants(self, group_id: int, user_ids: List[int]) -> Set[int]:
+        """
+        Добавляет участников одним многострочным INSERT ... ON CONFLICT DO NOTHING
+        и возвращает id тех, кто был добавлен впервые.
+        """
+        if not user_ids:
+            return set()
+        result = await self.session.execute(
+            insert(group_participants)
+            .values([{"group_id": group_id, "user_id": user_id} for user_id in user_ids])
+            .on_conflict_do_nothing()
+            .returning(group_participants.c.user_id)
+        )
+        added = set(result.scalars().all())
+        await self.session.commit()
+        await membership_cache.add_members(group_id, added)
+        return added
+
+    async def remove_participants(self, group_id: int, user_ids: List[int]) -> Set[int]:
+        """
+        Удаляет участников одним DELETE ... = ANY(...) и возвращает id тех,
+        кто действительно состоял в группе.
+        """
+        if not user_ids:
+            return set()
         result = await self.session.execute(
-            select(group_participants).filter(
+            delete(group_participants)
+            .where(
                 group_participants.c.group_id == group_id,
-                group_participants.c.user_id == user_id
+                group_participants.c.user_id == any_(bindparam("user_ids", user_ids, type_=ARRAY(Integer)))
             )
+            .returning(group_participants.c.user_id)
+        )
+        removed = set(result.scalars().all())
+        await self.session.commit()
+        await membership_cache.remove_members(group_id, removed)
+        return removed
+
+    async def get_participant_ids(self, group_id: int) -> List[int]:
+        result = await self.session.execute(
+            select(group_participants.c.user_id).filter(group_participants.c.group_id == group_id)
+        )
+        return list(result.scalars().all())
+
+    async def is_participant(self, group_id: int, user_id: int) -> bool:
+        return await membership_cache.is_member(
+            group_id, user_id, lambda: self.get_participant_ids(group_id)
         )
-        return bool(result.first())
\ No newline at end of file
@@ -1,7 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models.models import Message
-from typing import Optional, List
+from sqlalchemy import select, func, and_, tuple_, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from app.models.models import Message, group_participants
+from app.repositories.chat_repository import ChatRepository
+from typing import AsyncIterator, Dict, Optional, List, Tuple
+
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
 
 class MessageRepository:
     def __init__(self, session: AsyncSession):
@@ -10,9 +16,71 @@ class MessageRepository:
     async def create(self, message: Message) -> Message:
         self.session.add(message)
         await self.session.commit()
-        await self.session.refresh(message)
         return message
 
+    @staticmethod
+    def is_retry_of(message: Message, row: dict) -> bool:
+        """
+        Совпадение uuid считается повтором, только если сообщение отправлено
+        тем же пользователем в тот же чат.
+        """
+        return message.sender_id == row["sender_id"] and message.chat_id == row["chat_id"]
+
+    async def create_or_get(self, row: dict) -> Tuple[Message, bool]:
+        result = await self.session.scalars(
+            insert(Message)
+            .values(**row)
+            .on_conflict_do_nothing(index_elements=[Message.uuid])
+            .returning(Message)
+        )
+        message = result.first()
+        created = message is not None
+        if created:
+            await self._record_activity([message])
+        else:
+            message = await self.get_by_uuid(row["uuid"])
+        await self.session.commit()
+        return message, created
+
+    async def create_many(self, rows: List[dict]) -> List[Tuple[Message, bool]]:
+        result = await self.session.scalars(
+            insert(Message)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Message.uuid])
+            .returning(Message)
+        )
+        inserted = {message.uuid: message for message in result.all()}
+        if inserted:
+            await self._record_activity(list(inserted.values()))
+        missing = [row["uuid"] for row in rows if row["uuid"] not in inserted]
+        existing = {message.uuid: message for message in await self.get_by_uuids(missing)} if missing else {}
+        await self.session.commit()
+
+        messages = []
+        for row in rows:
+            message = inserted.pop(row["uuid"], None)
+            if message is not None:
+                existing[row["uuid"]] = message
+                messages.append((message, True))
+            else:
+                messages.append((existing[row["uuid"]], False))
+        return messages
+
+    async def _record_activity(self, messages: List[Message]):
+        """
+        Обновляет последнее сообщение чата в той же транзакции. Счётчики
+        непрочитанного здесь не трогаются: они считаются при чтении списка
+        чатов, и запись сообщения не зависит от числа участников.
+        """
+        by_chat: Dict[int, List[Message]] = {}
+        for message in messages:
+            by_chat.setdefault(message.chat_id, []).append(message)
+        chat_repo = ChatRepository(self.session)
+        for chat_id in sorted(by_chat):
+            chat_messages = by_chat[chat_id]
+            last_message = max(chat_messages, key=lambda message: message.id)
+            await chat_repo.touch_last_message(chat_id, last_message.id, last_message.timestamp)
+
     async def get_by_id(self, message_id: int) -> Optional[Message]:
         result = await self.session.execute(select(Message).filter(Message.id == message_id))
         return result.scalars().first()
@@ -21,15 +89,79 @@ class MessageRepository:
         result = await self.session.execute(select(Message).filter(Message.uuid == uuid))
         return result.scalars().first()
 
-    async def get_by_chat_id(self, chat_id: int, limit: int, offset: int) -> List[Message]:
-        result = await self.session.execute(
-            select(Message)
+    async def get_by_uuids(self, uuids: List[str]) -> List[Message]:
+        result = await self.session.execute(select(Message).filter(Message.uuid.in_(uuids)))
+        return result.scalars().all()
+
+    async def get_page(self, chat_id: int, limit: int, before_id: Optional[int] = None,
+                       after_id: Optional[int] = None) -> List[Message]:
+        query = select(Message).filter(Message.chat_id == chat_id)
+        if after_id is not None:
+            result = await self.session.execute(
+                query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit)
+            )
+            return list(reversed(result.scalars().all()))
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        result = await self.session.execute(query.order_by(Message.id.desc()).limit(limit))
+        return result.scalars().all()
+
+    async def stream_by_chat_id(self, chat_id: int, chunk_size: int) -> AsyncIterator[list]:
+        result = await self.session.stream(
+            select(
+                Message.id,
+                Message.chat_id,
+                Message.sender_id,
+                Message.text,
+                Message.timestamp,
+                Message.is_read
+            )
             .filter(Message.chat_id == chat_id)
-            .order_by(Message.timestamp.asc())
-            .limit(limit)
-            .offset(offset)
+            .order_by(Message.id.asc())
+            .execution_options(yield_per=chunk_size)
         )
-        return result.scalars().all()
+        async for partition in result.mappings().partitions():
+            yield partition
+
+    async def search(self, user_id: int, query: str, limit: int, chat_id: Optional[int] = None,
+                     after_rank: Optional[float] = None, after_id: Optional[int] = None) -> List[dict]:
+        ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        rank = func.ts_rank(Message.text_tsv, ts_query)
+        matches = (
+            select(
+                Message.id,
+                Message.chat_id,
+                Message.sender_id,
+                Message.text,
+                Message.timestamp,
+                Message.is_read,
+                rank.label("rank")
+            )
+            .join(
+                group_participants,
+                and_(
+                    group_participants.c.group_id == Message.chat_id,
+                    group_participants.c.user_id == user_id
+                )
+            )
+            .filter(Message.text_tsv.op("@@")(ts_query))
+        )
+        if chat_id is not None:
+            matches = matches.filter(Message.chat_id == chat_id)
+        if after_rank is not None:
+            matches = matches.filter(tuple_(rank, Message.id) < tuple_(after_rank, after_id))
+        matches = matches.order_by(rank.desc(), Message.id.desc()).limit(limit).subquery()
+
+        result = await self.session.execute(
+            select(
+                matches,
+                func.ts_headline(
+                    SEARCH_CONFIG, matches.c.text, ts_query, SEARCH_HEADLINE_OPTIONS
+                ).label("snippet")
+            )
+            .order_by(matches.c.rank.desc(), matches.c.id.desc())
+        )
+        return result.mappings().all()
 
     async def update(self, message: Message):
         await self.session.merge(message)
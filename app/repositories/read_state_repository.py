@@ -0,0 +1,34 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert
+from app.models.models import ChatReadState
+from typing import Optional, List
+
+
+class ReadStateRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def get(self, user_id: int, chat_id: int) -> Optional[ChatReadState]:
+        result = await self.session.execute(
+            select(ChatReadState).filter(
+                ChatReadState.user_id == user_id,
+                ChatReadState.chat_id == chat_id
+            )
+        )
+        return result.scalars().first()
+
+    async def upsert_watermarks(self, watermarks: List[dict]):
+        statement = insert(ChatReadState).values(watermarks)
+        statement = statement.on_conflict_do_update(
+            index_elements=[ChatReadState.user_id, ChatReadState.chat_id],
+            set_={
+                "last_read_message_id": func.greatest(
+                    ChatReadState.last_read_message_id,
+                    statement.excluded.last_read_message_id
+                ),
+                "updated_at": statement.excluded.updated_at
+            }
+        )
+        await self.session.execute(statement)
+        await self.session.commit()
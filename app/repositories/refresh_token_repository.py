@@ -0,0 +1,72 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete
+from app.models.models import RefreshToken
+from datetime import datetime
+from typing import Optional
+
+
+class RefreshTokenRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create(self, refresh_token: RefreshToken) -> RefreshToken:
+        self.session.add(refresh_token)
+        await self.session.commit()
+        return refresh_token
+
+    async def get_active(self, token: str) -> Optional[RefreshToken]:
+        result = await self.session.execute(
+            select(RefreshToken).filter(
+                RefreshToken.token == token,
+                RefreshToken.expires_at > datetime.utcnow()
+            )
+        )
+        return result.scalars().first()
+
+    async def rotate(self, token: str, new_token: str, expires_at: datetime) -> Optional[int]:
+        result = await self.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.token == token, RefreshToken.expires_at > datetime.utcnow())
+            .values(token=new_token, expires_at=expires_at)
+            .returning(RefreshToken.user_id)
+        )
+        user_id = result.scalar()
+        await self.session.commit()
+        return user_id
+
+    async def delete_by_token(self, token: str) -> bool:
+        result = await self.session.execute(
+            delete(RefreshToken).where(RefreshToken.token == token).returning(RefreshToken.id)
+        )
+        deleted = result.first() is not None
+        await self.session.commit()
+        return deleted
+
+    async def delete_by_user(self, user_id: int) -> int:
+        result = await self.session.execute(
+            delete(RefreshToken).where(RefreshToken.user_id == user_id).returning(RefreshToken.id)
+        )
+        deleted = len(result.all())
+        await self.session.commit()
+        return deleted
+
+    async def purge_expired(self, batch_size: int) -> int:
+        """
+        Удаляет не больше batch_size истёкших токенов, чтобы не держать
+        долгих блокировок на большой таблице. SKIP LOCKED позволяет воркерам,
+        очищающим таблицу одновременно, брать разные строки, а не ждать друг
+        друга на одних и тех же.
+        """
+        expired = (
+            select(RefreshToken.id)
+            .filter(RefreshToken.expires_at < datetime.utcnow())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            delete(RefreshToken).where(RefreshToken.id.in_(expired)).returning(RefreshToken.id)
+        )
+        deleted = len(result.all())
+        await self.session.commit()
+        return deleted
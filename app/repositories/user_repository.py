@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from app.models.models import User
-from typing import Optional
+from typing import Optional, List, Set
 
 class UserRepository:
     def __init__(self, session: AsyncSession):
@@ -19,4 +20,10 @@ class UserRepository:
 
     async def get_by_email(self, email: str) -> Optional[User]:
         result = await self.session.execute(select(User).filter(User.email == email))
-        return result.scalars().first()
\ No newline at end of file
+        return result.scalars().first()
+
+    async def get_existing_ids(self, user_ids: List[int]) -> Set[int]:
+        result = await self.session.execute(
+            select(User.id).filter(User.id == any_(bindparam("user_ids", user_ids, type_=ARRAY(Integer))))
+        )
+        return set(result.scalars().all())
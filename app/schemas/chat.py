@@ -1,5 +1,9 @@
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import List, Optional
+
+MAX_BULK_PARTICIPANTS = 5000
 
 class ChatType(str, Enum):
     PERSONAL = "personal"
@@ -16,4 +20,40 @@ class ChatResponse(ChatBase):
     id: int
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class LastMessagePreview(BaseModel):
+    id: int
+    sender_id: int
+    text: str
+    timestamp: datetime
+
+class InboxChat(BaseModel):
+    id: int
+    name: str
+    type: ChatType
+    last_activity: datetime
+    last_message: Optional[LastMessagePreview] = None
+    unread_count: int
+
+class InboxPage(BaseModel):
+    items: List[InboxChat]
+    next_cursor: Optional[str] = None
+
+class ParticipantStatus(str, Enum):
+    ADDED = "added"
+    REMOVED = "removed"
+    ALREADY_MEMBER = "already_member"
+    NOT_MEMBER = "not_member"
+    USER_NOT_FOUND = "user_not_found"
+
+class ParticipantsUpdate(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=MAX_BULK_PARTICIPANTS)
+
+class ParticipantOutcome(BaseModel):
+    user_id: int
+    status: ParticipantStatus
+
+class ParticipantsResult(BaseModel):
+    group_id: int
+    results: List[ParticipantOutcome]
@@ -1,5 +1,11 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Literal, Optional
+
+# messages.id — INTEGER: значения вне диапазона отвергает Postgres.
+MAX_MESSAGE_ID = 2 ** 31 - 1
+MAX_MESSAGE_LENGTH = 2000
+MAX_MESSAGE_UUID_LENGTH = 36
 
 class MessageBase(BaseModel):
     text: str
@@ -16,4 +22,31 @@ class MessageResponse(MessageBase):
     is_read: bool
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
+class MessageSearchResult(MessageResponse):
+    rank: float
+    snippet: str
+
+
+class MessageSearchPage(BaseModel):
+    items: List[MessageSearchResult]
+    next_cursor: Optional[str] = None
+
+
+class MessageEvent(BaseModel):
+    type: Literal["message"] = "message"
+    message: MessageResponse
+
+
+class ReadUpToEvent(BaseModel):
+    type: Literal["read_up_to"] = "read_up_to"
+    chat_id: int
+    user_id: int
+    message_id: int
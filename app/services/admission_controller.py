@@ -0,0 +1,74 @@
+from prometheus_client import Counter, Gauge
+from typing import Optional
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "10000"))
+WS_MAX_LOOP_LAG_MS = int(os.getenv("WS_MAX_LOOP_LAG_MS", "250"))
+LOOP_LAG_INTERVAL_MS = int(os.getenv("LOOP_LAG_INTERVAL_MS", "500"))
+
+event_loop_lag_seconds = Gauge(
+    'event_loop_lag_seconds', 'Delay of the last event loop lag probe beyond its scheduled time'
+)
+websocket_admission_rejected_total = Counter(
+    'websocket_admission_rejected_total', 'WebSocket connections refused by admission control', ['reason']
+)
+
+
+class AdmissionController:
+    """
+    Решает, может ли воркер принять новый WebSocket. Сокет отклоняется, если
+    на воркере уже слишком много соединений или event loop не успевает
+    обрабатывать события. Задержку цикла измеряет фоновая задача: насколько
+    позже запланированного она просыпается.
+    """
+
+    def __init__(self, max_connections: int = WS_MAX_CONNECTIONS, max_lag: float = WS_MAX_LOOP_LAG_MS / 1000,
+                 interval: float = LOOP_LAG_INTERVAL_MS / 1000):
+        self.max_connections = max_connections
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lag = 0.0
+        self.monitor_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.monitor_task = asyncio.create_task(self._monitor())
+        logger.info("Admission controller started")
+
+    async def stop(self):
+        if self.monitor_task:
+            self.monitor_task.cancel()
+            try:
+                await self.monitor_task
+            except asyncio.CancelledError:
+                pass
+            self.monitor_task = None
+        self.lag = 0.0
+
+    def reject_reason(self, connection_count: int) -> Optional[str]:
+        """
+        Возвращает причину отказа или None, если соединение можно принять.
+        """
+        if self.max_connections > 0 and connection_count >= self.max_connections:
+            reason = "connections"
+        elif self.max_lag > 0 and self.lag > self.max_lag:
+            reason = "loop_lag"
+        else:
+            return None
+        websocket_admission_rejected_total.labels(reason=reason).inc()
+        logger.warning(f"WebSocket refused: {reason}, connections={connection_count}, lag={self.lag:.3f}s")
+        return reason
+
+    async def _monitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled_at = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - scheduled_at)
+            event_loop_lag_seconds.set(self.lag)
+
+
+admission_controller = AdmissionController()
@@ -2,9 +2,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.repositories.chat_repository import ChatRepository
 from app.repositories.group_repository import GroupRepository
 from app.repositories.user_repository import UserRepository
-from app.schemas.chat import ChatCreate, ChatResponse
+from app.schemas.chat import ChatCreate, ChatResponse, InboxChat, InboxPage, LastMessagePreview
 from app.models.models import Chat, ChatType
+from app.services.pagination import encode_cursor, decode_cursor
 from fastapi import HTTPException
+from datetime import datetime
+from typing import Optional
 
 
 class ChatService:
@@ -19,19 +22,12 @@ class ChatService:
             raise HTTPException(status_code=404, detail="User not found")
 
 
-        existing_chat = await self.chat_repo.get_personal_chat(user1_id, user2_id)
-        if existing_chat:
-            raise HTTPException(status_code=400, detail="Personal chat already exists")
-
-        chat = Chat(
-            name=f"Chat {user1_id}-{user2_id}",
-            type=ChatType.PERSONAL
+        chat, created = await self.chat_repo.get_or_create_personal_chat(
+            user1_id, user2_id, name=f"Chat {user1_id}-{user2_id}"
         )
-        created_chat = await self.chat_repo.create(chat)
-
-
-        await self.chat_repo.add_participants(created_chat.id, [user1_id, user2_id])
-        return ChatResponse.model_validate(created_chat)
+        if not created:
+            raise HTTPException(status_code=400, detail="Personal chat already exists")
+        return ChatResponse.model_validate(chat)
 
     async def create_group_chat(self, chat_data: ChatCreate, creator_id: int) -> ChatResponse:
 
@@ -52,4 +48,39 @@ class ChatService:
         chat = await self.chat_repo.get_by_id(chat_id)
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
-        return ChatResponse.model_validate(chat)
\ No newline at end of file
+        return ChatResponse.model_validate(chat)
+
+    async def get_inbox(self, user_id: int, limit: int = 50, cursor: Optional[str] = None) -> InboxPage:
+        key = decode_cursor(cursor, str, int)
+        try:
+            before_activity = datetime.fromisoformat(key[0]) if key else None
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        rows = await self.chat_repo.get_inbox(
+            user_id,
+            limit + 1,
+            before_activity=before_activity,
+            before_id=key[1] if key else None
+        )
+        items = []
+        for row in rows[:limit]:
+            last_message = None
+            if row["last_message_id"] is not None:
+                last_message = LastMessagePreview(
+                    id=row["last_message_id"],
+                    sender_id=row["last_message_sender_id"],
+                    text=row["last_message_text"],
+                    timestamp=row["last_message_timestamp"]
+                )
+            items.append(InboxChat(
+                id=row["id"],
+                name=row["name"],
+                type=row["type"].value,
+                last_activity=row["last_activity"],
+                last_message=last_message,
+                unread_count=row["unread_count"]
+            ))
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = encode_cursor(items[-1].last_activity.isoformat(), items[-1].id)
+        return InboxPage(items=items, next_cursor=next_cursor)
@@ -0,0 +1,326 @@
+from fastapi import WebSocket
+from app.services.redis_service import RedisService
+from app.services.membership_cache import membership_cache
+from prometheus_client import Counter
+from typing import Dict, List, Optional, Set, Tuple
+import redis.asyncio as redis
+import asyncio
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "chat:"
+EVENT_ID_PREFIX = '{"event_id":"'
+REPLAY_BUFFER_SIZE = int(os.getenv("WS_REPLAY_BUFFER_SIZE", "1000"))
+MEMBERSHIP_CHANNEL = "membership"
+MEMBERSHIP_ADDED = "added"
+MEMBERSHIP_REMOVED = "removed"
+CLOSE_POLICY_VIOLATION = 1008
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+OVERFLOW_POLICY = os.getenv("WS_OVERFLOW_POLICY", "drop_oldest").lower()
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+CLOSE_TRY_AGAIN_LATER = 1013
+
+websocket_frames_dropped_total = Counter(
+    'websocket_frames_dropped_total', 'Outbound WebSocket frames dropped because of a full send queue'
+)
+websocket_slow_consumers_total = Counter(
+    'websocket_slow_consumers_total', 'WebSocket connections closed because of a full send queue'
+)
+
+
+def parse_event_id(event_id: str) -> Tuple[int, int]:
+    milliseconds, _, sequence = event_id.partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+def with_event_id(frame: str, event_id: str) -> str:
+    return f'{EVENT_ID_PREFIX}{event_id}",{frame[1:]}'
+
+
+def frame_event_id(frame: str) -> str:
+    return frame[len(EVENT_ID_PREFIX):frame.index('"', len(EVENT_ID_PREFIX))]
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, user_id: Optional[int] = None,
+                 max_queue_size: int = SEND_QUEUE_SIZE, overflow_policy: str = OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.chat_ids: Set[int] = set()
+        self.bound_chat_id: Optional[int] = None
+        self.replaying: Dict[int, List[str]] = {}
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.overflow_policy = overflow_policy
+        self.writer_task: Optional[asyncio.Task] = None
+        self.close_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def start(self):
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def send(self, frame: str) -> bool:
+        """
+        Ставит уже сериализованный кадр в очередь сокета без ожидания отправки.
+        """
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow_policy == OVERFLOW_DISCONNECT:
+            websocket_slow_consumers_total.inc()
+            logger.warning("Send queue overflow, closing slow WebSocket consumer")
+            # closed выставляется сразу, чтобы следующие кадры до закрытия
+            # сокета не запускали повторное закрытие.
+            self.closed = True
+            self.close_task = asyncio.create_task(self._close_socket(CLOSE_TRY_AGAIN_LATER, "Slow consumer"))
+            return False
+
+        self.queue.get_nowait()
+        self.queue.put_nowait(frame)
+        websocket_frames_dropped_total.inc()
+        return True
+
+    def send_json(self, payload: dict) -> bool:
+        return self.send(json.dumps(payload))
+
+    async def put(self, frame: str):
+        """
+        Ставит кадр в очередь, дожидаясь места вместо политики переполнения.
+        """
+        if not self.closed:
+            await self.queue.put(frame)
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        if self.closed:
+            return
+        self.closed = True
+        await self._close_socket(code, reason)
+
+    async def _close_socket(self, code: int, reason: Optional[str]):
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _writer(self):
+        try:
+            while True:
+                frame = await self.queue.get()
+                await self.websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"WebSocket writer stopped: {str(e)}")
+            self.closed = True
+
+
+class ConnectionManager:
+    def __init__(self):
+        self.chat_connections: Dict[int, Set[Connection]] = {}
+        self.user_connections: Dict[int, Set[Connection]] = {}
+        self.connection_count = 0
+        self.redis_service: Optional[RedisService] = None
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def channel(chat_id: int) -> str:
+        return f"{CHANNEL_PREFIX}{chat_id}"
+
+    @staticmethod
+    def stream(chat_id: int) -> str:
+        return f"{CHANNEL_PREFIX}{chat_id}:events"
+
+    async def start(self, pool: redis.ConnectionPool):
+        """
+        Подключает менеджер к пулу Redis. Подписки создаются лениво,
+        только для чатов, у которых есть локальные сокеты.
+        """
+        self.redis_service = RedisService(pool)
+        self.pubsub = self.redis_service.pubsub()
+        await self.pubsub.subscribe(MEMBERSHIP_CHANNEL)
+        self.listener_task = asyncio.create_task(self._listen())
+        logger.info("Connection manager started")
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        if self.pubsub:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        self.chat_connections.clear()
+        self.user_connections.clear()
+        self.connection_count = 0
+        logger.info("Connection manager stopped")
+
+    def register(self, websocket: WebSocket, user_id: int) -> Connection:
+        connection = Connection(websocket, user_id=user_id)
+        connection.start()
+        self.user_connections.setdefault(user_id, set()).add(connection)
+        self.connection_count += 1
+        return connection
+
+    async def unregister(self, connection: Connection):
+        if connection.writer_task:
+            connection.writer_task.cancel()
+        connection.closed = True
+        for chat_id in list(connection.chat_ids):
+            await self.unsubscribe(connection, chat_id)
+        connections = self.user_connections.get(connection.user_id)
+        if connections is not None and connection in connections:
+            connections.discard(connection)
+            self.connection_count -= 1
+            if not connections:
+                del self.user_connections[connection.user_id]
+
+    async def subscribe(self, connection: Connection, chat_id: int, last_seen_id: Optional[str] = None):
+        if last_seen_id is not None:
+            connection.replaying[chat_id] = []
+        if chat_id not in self.chat_connections:
+            self.chat_connections[chat_id] = set()
+            await self.pubsub.subscribe(self.channel(chat_id))
+            logger.debug(f"Subscribed to channel for chat: {chat_id}")
+        self.chat_connections[chat_id].add(connection)
+        connection.chat_ids.add(chat_id)
+        if last_seen_id is not None:
+            await self.replay(connection, chat_id, last_seen_id)
+
+    async def replay(self, connection: Connection, chat_id: int, last_seen_id: str):
+        """
+        Досылает события, пропущенные после last_seen_id, из буфера чата в Redis.
+        Живые события, пришедшие во время чтения буфера, придерживаются и
+        отправляются следом без пропусков и дублей.
+        """
+        try:
+            replayed_id = parse_event_id(last_seen_id)
+        except ValueError:
+            logger.warning(f"Invalid last_seen_id for chat {chat_id}: {last_seen_id}")
+            connection.send_json({"type": "error", "chat_id": chat_id, "detail": "Invalid last_seen_id"})
+            connection.replaying.pop(chat_id, None)
+            return
+        try:
+            first_id = await self.redis_service.first_event_id(self.stream(chat_id))
+            if first_id is not None and parse_event_id(first_id) > replayed_id:
+                logger.info(f"Replay buffer for chat {chat_id} no longer covers {last_seen_id}")
+                connection.send_json({"type": "resync_required", "chat_id": chat_id})
+            else:
+                # XADD MAXLEN ~ может хранить больше REPLAY_BUFFER_SIZE событий,
+                # поэтому буфер читается страницами до конца.
+                after_id, replayed = last_seen_id, 0
+                while True:
+                    events = await self.redis_service.read_events(self.stream(chat_id), after_id, REPLAY_BUFFER_SIZE)
+                    for event_id, frame in events:
+                        await connection.put(with_event_id(frame, event_id))
+                        replayed_id = parse_event_id(event_id)
+                    replayed += len(events)
+                    if len(events) < REPLAY_BUFFER_SIZE:
+                        break
+                    after_id = events[-1][0]
+                logger.debug(f"Replayed {replayed} events for chat {chat_id}")
+        except Exception as e:
+            logger.error(f"Failed to replay events for chat {chat_id}: {str(e)}")
+            connection.send_json({"type": "resync_required", "chat_id": chat_id})
+
+        for frame in connection.replaying.pop(chat_id, []):
+            if parse_event_id(frame_event_id(frame)) > replayed_id:
+                connection.send(frame)
+
+    async def unsubscribe(self, connection: Connection, chat_id: int):
+        connection.chat_ids.discard(chat_id)
+        connection.replaying.pop(chat_id, None)
+        connections = self.chat_connections.get(chat_id)
+        if not connections or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self.chat_connections[chat_id]
+            if self.pubsub:
+                await self.pubsub.unsubscribe(self.channel(chat_id))
+            logger.debug(f"Unsubscribed from channel for chat: {chat_id}")
+
+    async def connect(self, chat_id: int, websocket: WebSocket, user_id: int,
+                      last_seen_id: Optional[str] = None) -> Connection:
+        connection = self.register(websocket, user_id)
+        connection.bound_chat_id = chat_id
+        await self.subscribe(connection, chat_id, last_seen_id)
+        return connection
+
+    async def disconnect(self, connection: Connection):
+        await self.unregister(connection)
+
+    async def publish(self, chat_id: int, frame: str):
+        """
+        Публикует сериализованное событие чата для всех воркеров, включая текущий,
+        и сохраняет его в буфер чата для досылки после переподключения.
+        """
+        await self.redis_service.publish_event(
+            self.stream(chat_id), self.channel(chat_id), frame, REPLAY_BUFFER_SIZE
+        )
+
+    async def publish_membership_change(self, chat_id: int, user_ids: List[int], action: str):
+        """
+        Сообщает всем воркерам об изменении состава чата, чтобы они сбросили
+        закэшированные на соединениях права доступа.
+        """
+        await self.redis_service.publish(
+            MEMBERSHIP_CHANNEL, json.dumps({"chat_id": chat_id, "user_ids": user_ids, "action": action})
+        )
+
+    async def apply_membership_change(self, chat_id: int, user_id: int, action: str):
+        membership_cache.invalidate_local(chat_id)
+        if action != MEMBERSHIP_REMOVED:
+            return
+        for connection in list(self.user_connections.get(user_id, ())):
+            if chat_id not in connection.chat_ids:
+                continue
+            await self.unsubscribe(connection, chat_id)
+            logger.info(f"Revoked access to chat {chat_id} for user {user_id} connection")
+            if connection.bound_chat_id == chat_id:
+                await connection.close(code=CLOSE_POLICY_VIOLATION, reason="User not in chat")
+            else:
+                connection.send_json({"type": "unsubscribed", "chat_id": chat_id, "reason": "removed"})
+
+    def deliver(self, chat_id: int, frame: str):
+        for connection in list(self.chat_connections.get(chat_id, ())):
+            held = connection.replaying.get(chat_id)
+            if held is not None:
+                held.append(frame)
+            else:
+                connection.send(frame)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None or message["type"] != "message":
+                    continue
+                if message["channel"] == MEMBERSHIP_CHANNEL:
+                    change = json.loads(message["data"])
+                    for user_id in change["user_ids"]:
+                        await self.apply_membership_change(change["chat_id"], user_id, change["action"])
+                    continue
+                chat_id = int(message["channel"][len(CHANNEL_PREFIX):])
+                self.deliver(chat_id, message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Pub/sub listener error: {str(e)}")
+                await asyncio.sleep(1.0)
+
+
+connection_manager = ConnectionManager()
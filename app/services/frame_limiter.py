@@ -0,0 +1,167 @@
+from app.services.redis_service import RedisService
+from collections import OrderedDict
+from prometheus_client import Counter
+from typing import Dict, NamedTuple, Optional
+import redis.asyncio as redis
+import weakref
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+FRAME_RATE_PREFIX = "ws_bucket:"
+WS_RATE_LIMIT_REDIS = os.getenv("WS_RATE_LIMIT_REDIS", "False").lower() == "true"
+WS_RATE_LIMIT_USERS = int(os.getenv("WS_RATE_LIMIT_USERS", "10000"))
+
+websocket_frames_rate_limited_total = Counter(
+    'websocket_frames_rate_limited_total', 'Inbound WebSocket frames rejected by a token bucket', ['frame_type', 'scope']
+)
+
+
+class FrameRateRule(NamedTuple):
+    name: str
+    connection_rate: float
+    connection_burst: int
+    user_rate: float
+    user_burst: int
+
+
+MESSAGE_FRAME_RULE = FrameRateRule(
+    "message",
+    float(os.getenv("WS_MESSAGE_RATE", "5")),
+    int(os.getenv("WS_MESSAGE_BURST", "10")),
+    float(os.getenv("WS_USER_MESSAGE_RATE", "10")),
+    int(os.getenv("WS_USER_MESSAGE_BURST", "30"))
+)
+READ_FRAME_RULE = FrameRateRule(
+    "read",
+    float(os.getenv("WS_READ_RATE", "20")),
+    int(os.getenv("WS_READ_BURST", "40")),
+    float(os.getenv("WS_USER_READ_RATE", "50")),
+    int(os.getenv("WS_USER_READ_BURST", "100"))
+)
+FRAME_RULES = {
+    "message": MESSAGE_FRAME_RULE,
+    "read": READ_FRAME_RULE,
+    "read_up_to": READ_FRAME_RULE,
+}
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """
+        Пополняет ведро и возвращает время в секундах до появления токена.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class FrameRateLimiter:
+    """
+    Ограничивает частоту входящих кадров message и read token bucket'ами на
+    соединение и на пользователя. Ведра хранятся в памяти воркера, поэтому
+    превышение лимита отсекается без обращения к сети. С WS_RATE_LIMIT_REDIS
+    пользовательский лимит дополнительно проверяется по общему ведру в Redis,
+    и сокеты одного пользователя на разных воркерах делят один бюджет.
+    Ведра соединения удаляются вместе с ним (WeakKeyDictionary).
+    """
+
+    def __init__(self, rules: Dict[str, FrameRateRule] = FRAME_RULES, use_redis: bool = WS_RATE_LIMIT_REDIS,
+                 max_users: int = WS_RATE_LIMIT_USERS):
+        self.rules = rules
+        self.use_redis = use_redis
+        self.max_users = max_users
+        self.connection_buckets: "weakref.WeakKeyDictionary[object, Dict[str, TokenBucket]]" = \
+            weakref.WeakKeyDictionary()
+        self.user_buckets: "OrderedDict[int, Dict[str, TokenBucket]]" = OrderedDict()
+        self.redis_service: Optional[RedisService] = None
+
+    async def start(self, pool: redis.ConnectionPool):
+        if self.use_redis:
+            self.redis_service = RedisService(pool)
+        logger.info(f"Frame rate limiter started: redis={self.redis_service is not None}")
+
+    async def stop(self):
+        self.redis_service = None
+        self.connection_buckets.clear()
+        self.user_buckets.clear()
+
+    @staticmethod
+    def key(rule: FrameRateRule, user_id: int) -> str:
+        return f"{FRAME_RATE_PREFIX}{rule.name}:{user_id}"
+
+    async def acquire(self, connection: object, user_id: int, frame_type: str) -> float:
+        """
+        Учитывает кадр. Возвращает 0, если кадр допущен, иначе время в
+        секундах, через которое его можно повторить.
+        """
+        rule = self.rules.get(frame_type)
+        if rule is None:
+            return 0.0
+        now = time.monotonic()
+        buckets = []
+        if rule.connection_rate > 0:
+            connection_buckets = self.connection_buckets.setdefault(connection, {})
+            buckets.append(("connection", self._bucket(
+                connection_buckets, rule.name, rule.connection_rate, rule.connection_burst
+            )))
+        if rule.user_rate > 0:
+            buckets.append(("user", self._bucket(
+                self._user_buckets(user_id), rule.name, rule.user_rate, rule.user_burst
+            )))
+        for scope, bucket in buckets:
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                websocket_frames_rate_limited_total.labels(frame_type=rule.name, scope=scope).inc()
+                return wait
+        for _, bucket in buckets:
+            bucket.take()
+
+        if self.redis_service is None or rule.user_rate <= 0:
+            return 0.0
+        try:
+            allowed, retry_after_ms = await self.redis_service.token_bucket_take(
+                self.key(rule, user_id), rule.user_rate, rule.user_burst
+            )
+        except Exception as e:
+            logger.error(f"Frame rate limiter error for user {user_id}: {str(e)}")
+            return 0.0
+        if allowed:
+            return 0.0
+        websocket_frames_rate_limited_total.labels(frame_type=rule.name, scope="shared").inc()
+        return max(retry_after_ms, 1) / 1000
+
+    def _user_buckets(self, user_id: int) -> Dict[str, TokenBucket]:
+        buckets = self.user_buckets.get(user_id)
+        if buckets is None:
+            buckets = self.user_buckets[user_id] = {}
+            # Вытесняется давно неактивный пользователь: его ведро и так
+            # успело бы наполниться.
+            while len(self.user_buckets) > self.max_users:
+                self.user_buckets.popitem(last=False)
+        else:
+            self.user_buckets.move_to_end(user_id)
+        return buckets
+
+    @staticmethod
+    def _bucket(buckets: Dict[str, TokenBucket], name: str, rate: float, capacity: int) -> TokenBucket:
+        bucket = buckets.get(name)
+        if bucket is None:
+            bucket = buckets[name] = TokenBucket(rate, capacity)
+        return bucket
+
+
+frame_rate_limiter = FrameRateLimiter()
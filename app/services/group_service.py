@@ -1,44 +1,77 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.repositories.group_repository import GroupRepository
+from app.repositories.user_repository import UserRepository
+from app.services.connection_manager import connection_manager, MEMBERSHIP_ADDED, MEMBERSHIP_REMOVED
 from app.models.models import Group
 from app.schemas.user import UserRole
+from app.schemas.chat import ParticipantOutcome, ParticipantsResult, ParticipantStatus
 from fastapi import HTTPException
+from typing import List
 
 
 class GroupService:
     def __init__(self, session: AsyncSession):
         self.group_repo = GroupRepository(session)
+        self.user_repo = UserRepository(session)
 
     async def create_group(self, chat_id: int, creator_id: int, name: str) -> Group:
         group = Group(name=name, creator_id=creator_id, chat_id=chat_id)
         return await self.group_repo.create(group)
 
     async def add_participant(self, group_id: int, user_id: int, current_user_id: int):
-        group = await self.group_repo.get_by_id(group_id)
-        if not group:
-            raise HTTPException(status_code=404, detail="Group not found")
+        group = await self._get_managed_group(group_id, current_user_id, "add")
+        await self.group_repo.add_participant(group_id, user_id)
+        await connection_manager.publish_membership_change(group.chat_id, [user_id], MEMBERSHIP_ADDED)
 
+    async def remove_participant(self, group_id: int, user_id: int, current_user_id: int):
+        group = await self._get_managed_group(group_id, current_user_id, "remove")
+        await self.group_repo.remove_participant(group_id, user_id)
+        await connection_manager.publish_membership_change(group.chat_id, [user_id], MEMBERSHIP_REMOVED)
 
-        if group.creator_id != current_user_id:
-            from app.services.user_service import UserService
-            user_service = UserService(self.group_repo.session)
-            is_admin = await user_service.check_user_role(current_user_id, UserRole.ADMIN)
-            if not is_admin:
-                raise HTTPException(status_code=403, detail="Only group creator or admin can add participants")
+    async def add_participants(self, group_id: int, user_ids: List[int], current_user_id: int) -> ParticipantsResult:
+        group = await self._get_managed_group(group_id, current_user_id, "add")
+        user_ids = list(dict.fromkeys(user_ids))
+        existing = await self.user_repo.get_existing_ids(user_ids)
+        added = await self.group_repo.add_participants(group_id, [user_id for user_id in user_ids if user_id in existing])
+        if added:
+            await connection_manager.publish_membership_change(group.chat_id, sorted(added), MEMBERSHIP_ADDED)
 
-        await self.group_repo.add_participant(group_id, user_id)
+        results = []
+        for user_id in user_ids:
+            if user_id not in existing:
+                status = ParticipantStatus.USER_NOT_FOUND
+            elif user_id in added:
+                status = ParticipantStatus.ADDED
+            else:
+                status = ParticipantStatus.ALREADY_MEMBER
+            results.append(ParticipantOutcome(user_id=user_id, status=status))
+        return ParticipantsResult(group_id=group_id, results=results)
 
-    async def remove_participant(self, group_id: int, user_id: int, current_user_id: int):
+    async def remove_participants(self, group_id: int, user_ids: List[int], current_user_id: int) -> ParticipantsResult:
+        group = await self._get_managed_group(group_id, current_user_id, "remove")
+        user_ids = list(dict.fromkeys(user_ids))
+        removed = await self.group_repo.remove_participants(group_id, user_ids)
+        if removed:
+            await connection_manager.publish_membership_change(group.chat_id, sorted(removed), MEMBERSHIP_REMOVED)
+
+        results = [
+            ParticipantOutcome(
+                user_id=user_id,
+                status=ParticipantStatus.REMOVED if user_id in removed else ParticipantStatus.NOT_MEMBER
+            )
+            for user_id in user_ids
+        ]
+        return ParticipantsResult(group_id=group_id, results=results)
+
+    async def _get_managed_group(self, group_id: int, current_user_id: int, action: str) -> Group:
         group = await self.group_repo.get_by_id(group_id)
         if not group:
             raise HTTPException(status_code=404, detail="Group not found")
 
-
         if group.creator_id != current_user_id:
             from app.services.user_service import UserService
             user_service = UserService(self.group_repo.session)
             is_admin = await user_service.check_user_role(current_user_id, UserRole.ADMIN)
             if not is_admin:
-                raise HTTPException(status_code=403, detail="Only group creator or admin can remove participants")
-
-        await self.group_repo.remove_participant(group_id, user_id)
\ No newline at end of file
+                raise HTTPException(status_code=403, detail=f"Only group creator or admin can {action} participants")
+        return group
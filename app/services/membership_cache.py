@@ -0,0 +1,132 @@
+from app.services.redis_service import RedisService
+from collections import OrderedDict
+from typing import Awaitable, Callable, FrozenSet, Iterable, Optional, Tuple
+import redis.asyncio as redis
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+MEMBERSHIP_CACHE_TTL = int(os.getenv("MEMBERSHIP_CACHE_TTL", "3600"))
+MEMBERSHIP_LOCAL_CACHE_SIZE = int(os.getenv("MEMBERSHIP_LOCAL_CACHE_SIZE", "1024"))
+MEMBERSHIP_LOCAL_CACHE_TTL_MS = int(os.getenv("MEMBERSHIP_LOCAL_CACHE_TTL_MS", "1000"))
+MEMBERS_PREFIX = "members:"
+LOADED_MARKER = "*"
+
+MembersLoader = Callable[[], Awaitable[Iterable[int]]]
+
+
+class MembershipCache:
+    """
+    Кэш состава чатов: множество в Redis на каждый чат и небольшой LRU в
+    памяти воркера. Множество загружается из group_participants при первом
+    обращении и обновляется при изменении состава.
+    """
+
+    def __init__(self, ttl: int = MEMBERSHIP_CACHE_TTL, local_size: int = MEMBERSHIP_LOCAL_CACHE_SIZE,
+                 local_ttl: float = MEMBERSHIP_LOCAL_CACHE_TTL_MS / 1000):
+        self.ttl = ttl
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.local: "OrderedDict[int, Tuple[float, FrozenSet[int]]]" = OrderedDict()
+        self.redis_service: Optional[RedisService] = None
+
+    @staticmethod
+    def key(chat_id: int) -> str:
+        return f"{MEMBERS_PREFIX}{chat_id}"
+
+    @staticmethod
+    def generation_key(chat_id: int) -> str:
+        return f"{MEMBERS_PREFIX}{chat_id}:generation"
+
+    async def start(self, pool: redis.ConnectionPool):
+        self.redis_service = RedisService(pool)
+        logger.info("Membership cache started")
+
+    async def stop(self):
+        self.redis_service = None
+        self.local.clear()
+        logger.info("Membership cache stopped")
+
+    async def is_member(self, chat_id: int, user_id: int, loader: MembersLoader) -> bool:
+        members = self._get_local(chat_id)
+        if members is not None:
+            return user_id in members
+        if self.redis_service is None:
+            return user_id in self._set_local(chat_id, await loader())
+        try:
+            if self.local_size > 0:
+                cached = await self.redis_service.get_set(self.key(chat_id))
+                if LOADED_MARKER in cached:
+                    cached.discard(LOADED_MARKER)
+                    return user_id in self._set_local(chat_id, (int(member) for member in cached))
+            else:
+                found, loaded = await self.redis_service.check_set(self.key(chat_id), str(user_id), LOADED_MARKER)
+                if loaded:
+                    return found
+            generation = await self.redis_service.get_generation(self.generation_key(chat_id))
+        except Exception as e:
+            logger.error(f"Membership cache error for chat {chat_id}: {str(e)}")
+            return user_id in set(await loader())
+        return user_id in await self._load(chat_id, generation, loader)
+
+    async def add_members(self, chat_id: int, user_ids: Iterable[int]):
+        await self._update(chat_id, "SADD", user_ids)
+
+    async def remove_members(self, chat_id: int, user_ids: Iterable[int]):
+        await self._update(chat_id, "SREM", user_ids)
+
+    def invalidate_local(self, chat_id: int):
+        self.local.pop(chat_id, None)
+
+    async def _load(self, chat_id: int, generation: str, loader: MembersLoader) -> FrozenSet[int]:
+        members = frozenset(await loader())
+        try:
+            stored = await self.redis_service.load_set(
+                self.key(chat_id), self.generation_key(chat_id), generation,
+                [LOADED_MARKER, *(str(member) for member in members)], self.ttl
+            )
+        except Exception as e:
+            logger.error(f"Failed to store members of chat {chat_id} in cache: {str(e)}")
+            return members
+        if stored:
+            self._set_local(chat_id, members)
+        logger.debug(f"Loaded {len(members)} members of chat {chat_id} into cache: stored={stored}")
+        return members
+
+    async def _update(self, chat_id: int, command: str, user_ids: Iterable[int]):
+        members = [str(user_id) for user_id in user_ids]
+        self.invalidate_local(chat_id)
+        if not members or self.redis_service is None:
+            return
+        try:
+            await self.redis_service.update_set(
+                self.key(chat_id), self.generation_key(chat_id), command, members, self.ttl
+            )
+        except Exception as e:
+            logger.error(f"Failed to update membership cache for chat {chat_id}: {str(e)}")
+
+    def _get_local(self, chat_id: int) -> Optional[FrozenSet[int]]:
+        entry = self.local.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, members = entry
+        if expires_at < time.monotonic():
+            del self.local[chat_id]
+            return None
+        self.local.move_to_end(chat_id)
+        return members
+
+    def _set_local(self, chat_id: int, members: Iterable[int]) -> FrozenSet[int]:
+        members = frozenset(members)
+        if self.local_size <= 0:
+            return members
+        self.local[chat_id] = (time.monotonic() + self.local_ttl, members)
+        self.local.move_to_end(chat_id)
+        while len(self.local) > self.local_size:
+            self.local.popitem(last=False)
+        return members
+
+
+membership_cache = MembershipCache()
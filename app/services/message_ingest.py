@@ -0,0 +1,173 @@
+from sqlalchemy import text
+from app.config import async_session, is_statement_error
+from app.repositories.message_repository import MessageRepository
+from app.repositories.chat_repository import ChatRepository
+from app.models.models import Message
+from app.schemas.message import MessageCreate, MessageResponse
+from app.services.message_service import validate_new_message
+from fastapi import HTTPException
+from datetime import datetime
+from typing import List, Optional, Tuple
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_INGEST_ENABLED = os.getenv("MESSAGE_INGEST_ENABLED", "False").lower() == "true"
+MESSAGE_INGEST_MAX_BATCH = int(os.getenv("MESSAGE_INGEST_MAX_BATCH", "500"))
+MESSAGE_INGEST_MAX_DELAY_MS = int(os.getenv("MESSAGE_INGEST_MAX_DELAY_MS", "5"))
+MESSAGE_INGEST_SYNCHRONOUS_COMMIT = os.getenv("MESSAGE_INGEST_SYNCHRONOUS_COMMIT", "on").lower()
+SYNCHRONOUS_COMMIT_MODES = {"on", "off", "local", "remote_write", "remote_apply"}
+
+PendingMessage = Tuple[dict, bool, asyncio.Future]
+# Маркер остановки в очереди: всё, что поставлено до него, будет записано.
+STOP = object()
+
+
+class MessageIngestPipeline:
+    def __init__(self, enabled: bool = MESSAGE_INGEST_ENABLED, max_batch: int = MESSAGE_INGEST_MAX_BATCH,
+                 max_delay: float = MESSAGE_INGEST_MAX_DELAY_MS / 1000,
+                 synchronous_commit: str = MESSAGE_INGEST_SYNCHRONOUS_COMMIT):
+        if synchronous_commit not in SYNCHRONOUS_COMMIT_MODES:
+            raise ValueError(f"Unsupported synchronous_commit mode: {synchronous_commit}")
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.synchronous_commit = synchronous_commit
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.writer_task: Optional[asyncio.Task] = None
+        self.stopping = False
+
+    async def start(self):
+        if not self.enabled:
+            return
+        self.writer_task = asyncio.create_task(self._run())
+        logger.info(
+            f"Message ingest pipeline started: batch={self.max_batch}, delay={self.max_delay * 1000:.0f}ms, "
+            f"synchronous_commit={self.synchronous_commit}"
+        )
+
+    async def stop(self):
+        """
+        Останавливает запись, не прерывая её: writer дописывает всё, что было
+        в очереди до остановки, и завершается сам.
+        """
+        if self.writer_task is None:
+            return
+        await self.queue.put(STOP)
+        await self.writer_task
+        self.writer_task = None
+        while not self.queue.empty():
+            await self._write(self._drain(self.max_batch))
+        logger.info("Message ingest pipeline stopped")
+
+    async def submit(self, message_data: MessageCreate, sender_id: int, message_uuid: str,
+                     chat_verified: bool = False) -> Tuple[MessageResponse, bool]:
+        """
+        Ставит сообщение в очередь на пакетную запись и ждёт, пока пакет
+        будет сохранён. Возвращает сообщение с id и временем из БД и признак
+        того, что оно вставлено впервые, а не найдено по uuid.
+        """
+        validate_new_message(message_data, message_uuid)
+        row = {
+            "chat_id": message_data.chat_id,
+            "sender_id": sender_id,
+            "text": message_data.text,
+            "timestamp": datetime.utcnow(),
+            "is_read": False,
+            "uuid": message_uuid
+        }
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((row, chat_verified, future))
+        return await future
+
+    def _drain(self, limit: int) -> List[PendingMessage]:
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is STOP:
+                self.stopping = True
+                break
+            batch.append(item)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.stopping = False
+        while not self.stopping:
+            item = await self.queue.get()
+            if item is STOP:
+                return
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch and not self.stopping:
+                batch.extend(self._drain(self.max_batch - len(batch)))
+                timeout = deadline - loop.time()
+                if len(batch) >= self.max_batch or timeout <= 0 or self.stopping:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is STOP:
+                    self.stopping = True
+                else:
+                    batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: List[PendingMessage]):
+        """
+        Записывает пачку одной транзакцией. Если БД отвергла пачку, строки
+        пишутся по одной, и ошибку получает только отправитель некорректной
+        строки.
+        """
+        batch = [pending for pending in batch if not pending[2].done()]
+        if not batch:
+            return
+        try:
+            written = await self._write_batch(batch)
+        except Exception as e:
+            if len(batch) > 1 and is_statement_error(e):
+                logger.warning(f"Message batch of {len(batch)} rejected, retrying row by row: {str(e)}")
+                for pending in batch:
+                    await self._write([pending])
+                return
+            logger.error(f"Failed to write message batch of {len(batch)}: {str(e)}")
+            for *_, future in batch:
+                self._reject(future, HTTPException(status_code=500, detail="Failed to save message"))
+            return
+
+        logger.debug(f"Wrote message batch: {sum(created for *_, created in written)} of {len(written)} rows")
+        for row, future, message, created in written:
+            if not created and not MessageRepository.is_retry_of(message, row):
+                self._reject(future, HTTPException(status_code=409, detail="Message UUID already in use"))
+            elif not future.done():
+                future.set_result((MessageResponse.model_validate(message), created))
+
+    async def _write_batch(self, batch: List[PendingMessage]) -> List[Tuple[dict, asyncio.Future, Message, bool]]:
+        accepted: List[Tuple[dict, asyncio.Future]] = []
+        async with async_session() as session:
+            chat_repo = ChatRepository(session)
+            message_repo = MessageRepository(session)
+            unverified_chats = {row["chat_id"] for row, chat_verified, _ in batch if not chat_verified}
+            existing_chats = await chat_repo.get_existing_ids(list(unverified_chats)) if unverified_chats else set()
+            for row, chat_verified, future in batch:
+                if not chat_verified and row["chat_id"] not in existing_chats:
+                    self._reject(future, HTTPException(status_code=404, detail="Chat not found"))
+                else:
+                    accepted.append((row, future))
+            if not accepted:
+                return []
+            if self.synchronous_commit != "on":
+                await session.execute(text(f"SET LOCAL synchronous_commit TO {self.synchronous_commit}"))
+            messages = await message_repo.create_many([row for row, _ in accepted])
+        return [(row, future, message, created) for (row, future), (message, created) in zip(accepted, messages)]
+
+    @staticmethod
+    def _reject(future: asyncio.Future, error: Exception):
+        if not future.done():
+            future.set_exception(error)
+
+
+message_ingest_pipeline = MessageIngestPipeline()
@@ -1,11 +1,29 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.repositories.message_repository import MessageRepository
 from app.repositories.chat_repository import ChatRepository
-from app.schemas.message import MessageCreate, MessageResponse
-from app.models.models import Message
+from app.schemas.message import (
+    MessageCreate, MessageResponse, MessagePage, MessageSearchPage, MessageSearchResult,
+    MAX_MESSAGE_LENGTH, MAX_MESSAGE_UUID_LENGTH
+)
+from app.services.pagination import encode_cursor, decode_cursor
 from fastapi import HTTPException
 from datetime import datetime
-from typing import List
+from typing import AsyncIterator, Optional, Tuple
+import json
+import os
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+
+def validate_new_message(message_data: MessageCreate, message_uuid: str):
+    """
+    Проверяет ограничения колонок messages до записи, чтобы некорректное
+    сообщение отклонялось с 400, а не ошибкой БД.
+    """
+    if len(message_data.text) > MAX_MESSAGE_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Message text exceeds {MAX_MESSAGE_LENGTH} characters")
+    if not isinstance(message_uuid, str) or len(message_uuid) > MAX_MESSAGE_UUID_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid message UUID")
 
 
 class MessageService:
@@ -14,30 +32,99 @@ class MessageService:
         self.chat_repo = ChatRepository(session)
 
     async def send_message(self, message_data: MessageCreate, sender_id: int, message_uuid: str) -> MessageResponse:
+        message, _ = await self.store_message(message_data, sender_id, message_uuid)
+        return message
 
-        if not await self.chat_repo.get_by_id(message_data.chat_id):
+    async def store_message(self, message_data: MessageCreate, sender_id: int, message_uuid: str,
+                            chat_verified: bool = False) -> Tuple[MessageResponse, bool]:
+        """
+        Идемпотентная вставка по клиентскому uuid. При повторе возвращает
+        ранее сохранённое сообщение и False вместо ошибки; uuid, занятый
+        сообщением другого отправителя или чата, даёт 409. chat_verified
+        пропускает проверку чата, если она уже выполнена для соединения.
+        """
+        validate_new_message(message_data, message_uuid)
+        if not chat_verified and not await self.chat_repo.get_by_id(message_data.chat_id):
             raise HTTPException(status_code=404, detail="Chat not found")
 
+        row = {
+            "chat_id": message_data.chat_id,
+            "sender_id": sender_id,
+            "text": message_data.text,
+            "timestamp": datetime.utcnow(),
+            "is_read": False,
+            "uuid": message_uuid
+        }
+        message, created = await self.message_repo.create_or_get(row)
+        if not created and not self.message_repo.is_retry_of(message, row):
+            raise HTTPException(status_code=409, detail="Message UUID already in use")
+        return MessageResponse.model_validate(message), created
 
-        if await self.message_repo.get_by_uuid(message_uuid):
-            raise HTTPException(status_code=400, detail="Message already exists")
+    async def get_chat_history(self, chat_id: int, limit: int = 50, before: Optional[str] = None,
+                               after: Optional[str] = None) -> MessagePage:
+        """
+        Страница истории от новых к старым. next_cursor передаётся в before
+        для более старой страницы, prev_cursor — в after для более новой.
+        """
+        if before is not None and after is not None:
+            raise HTTPException(status_code=400, detail="Use either before or after, not both")
+        before_key = decode_cursor(before, int)
+        after_key = decode_cursor(after, int)
+        messages = await self.message_repo.get_page(
+            chat_id,
+            limit + 1,
+            before_id=before_key[0] if before_key else None,
+            after_id=after_key[0] if after_key else None
+        )
 
-        message = Message(
-            chat_id=message_data.chat_id,
-            sender_id=sender_id,
-            text=message_data.text,
-            timestamp=datetime.utcnow(),
-            is_read=False,
-            uuid=message_uuid
+        has_more = len(messages) > limit
+        if after_key:
+            messages = messages[1:] if has_more else messages
+        else:
+            messages = messages[:limit]
+
+        items = [MessageResponse.model_validate(msg) for msg in messages]
+        next_cursor = prev_cursor = None
+        if items:
+            if after_key or has_more:
+                next_cursor = encode_cursor(items[-1].id)
+            if before_key or (after_key and has_more):
+                prev_cursor = encode_cursor(items[0].id)
+        return MessagePage(items=items, next_cursor=next_cursor, prev_cursor=prev_cursor)
+
+    async def search_messages(self, user_id: int, query: str, limit: int = 20, chat_id: Optional[int] = None,
+                              cursor: Optional[str] = None) -> MessageSearchPage:
+        key = decode_cursor(cursor, float, int)
+        rows = await self.message_repo.search(
+            user_id,
+            query,
+            limit + 1,
+            chat_id=chat_id,
+            after_rank=key[0] if key else None,
+            after_id=key[1] if key else None
         )
-        created_message = await self.message_repo.create(message)
-        return MessageResponse.model_validate(created_message)
+        items = [MessageSearchResult.model_validate(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1].rank, items[-1].id) if len(rows) > limit else None
+        return MessageSearchPage(items=items, next_cursor=next_cursor)
 
-    async def get_message_history(self, chat_id: int, limit: int = 10, offset: int = 0) -> List[MessageResponse]:
-        if not await self.chat_repo.get_by_id(chat_id):
-            raise HTTPException(status_code=404, detail="Chat not found")
-        messages = await self.message_repo.get_by_chat_id(chat_id, limit, offset)
-        return [MessageResponse.model_validate(msg) for msg in messages]
+    async def export_chat_history(self, chat_id: int, chunk_size: int = EXPORT_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        Отдаёт историю чата в формате NDJSON порциями по chunk_size строк,
+        читая её серверным курсором без загрузки всего чата в память.
+        """
+        async for rows in self.message_repo.stream_by_chat_id(chat_id, chunk_size):
+            lines = []
+            for row in rows:
+                lines.append(json.dumps({
+                    "id": row["id"],
+                    "chat_id": row["chat_id"],
+                    "sender_id": row["sender_id"],
+                    "text": row["text"],
+                    "timestamp": row["timestamp"].isoformat(),
+                    "is_read": row["is_read"]
+                }, ensure_ascii=False))
+            lines.append("")
+            yield "\n".join(lines).encode()
 
     async def mark_message_as_read(self, message_id: int, user_id: int) -> None:
         message = await self.message_repo.get_by_id(message_id)
@@ -0,0 +1,44 @@
+from fastapi import HTTPException
+from typing import Optional
+import base64
+import json
+import math
+
+MAX_CURSOR_INT = 2 ** 31 - 1
+
+
+def encode_cursor(*values) -> str:
+    """
+    Кодирует ключ keyset-пагинации в непрозрачную для клиента строку.
+    """
+    raw = json.dumps(list(values), separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], *types: type) -> Optional[list]:
+    """
+    Декодирует курсор и проверяет, что его элементы имеют ожидаемые типы:
+    int — целое в диапазоне INTEGER, float — конечное число, str — строка.
+    Подделанный курсор даёт 400, а не ошибку БД.
+    """
+    if cursor is None:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not all(_is_valid(value, expected) for value, expected in zip(values, types)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [float(value) if expected is float else value for value, expected in zip(values, types)]
+
+
+def _is_valid(value, expected: type) -> bool:
+    if isinstance(value, bool):
+        return False
+    if expected is int:
+        return isinstance(value, int) and abs(value) <= MAX_CURSOR_INT
+    if expected is float:
+        return isinstance(value, (int, float)) and math.isfinite(value)
+    return isinstance(value, expected)
@@ -0,0 +1,86 @@
+from passlib.context import CryptContext
+from prometheus_client import Counter, Gauge, Histogram
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from typing import Callable, Optional, Tuple, TypeVar
+import asyncio
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+password_hash_pending = Gauge(
+    'password_hash_pending', 'Password hash operations queued or running in the hashing pool'
+)
+password_hash_wait_seconds = Histogram(
+    'password_hash_wait_seconds', 'Time a password hash operation waited for a hashing worker',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+password_hash_rejected_total = Counter(
+    'password_hash_rejected_total', 'Password hash operations rejected because the hashing queue was full'
+)
+
+T = TypeVar("T")
+
+
+class PasswordHasher:
+    """
+    Выполняет bcrypt в общем пуле потоков, чтобы хэширование не блокировало
+    event loop. bcrypt отпускает GIL, поэтому потоки работают параллельно.
+    Очередь ограничена: при переполнении запрос получает 503.
+    """
+
+    def __init__(self, context: CryptContext = pwd_context, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.context = context
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Проверяет пароль и, если параметры хэша устарели (например, изменился
+        BCRYPT_ROUNDS), возвращает новый хэш для сохранения.
+        """
+        return await self._run(self.context.verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def _run(self, operation: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            password_hash_rejected_total.inc()
+            logger.warning(f"Password hashing queue is full: {self.pending} pending")
+            raise HTTPException(status_code=503, detail="Server is busy, try again later")
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        self.pending += 1
+        password_hash_pending.inc()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._timed, operation, time.monotonic(), *args
+            )
+        finally:
+            self.pending -= 1
+            password_hash_pending.dec()
+
+    @staticmethod
+    def _timed(operation: Callable[..., T], submitted_at: float, *args) -> T:
+        password_hash_wait_seconds.observe(time.monotonic() - submitted_at)
+        return operation(*args)
+
+
+password_hasher = PasswordHasher()
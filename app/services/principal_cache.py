@@ -0,0 +1,113 @@
+from app.services.redis_service import RedisService
+from app.schemas.user import UserRole
+from collections import OrderedDict
+from typing import Awaitable, Callable, NamedTuple, Optional, Tuple
+import redis.asyncio as redis
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_REDIS = os.getenv("PRINCIPAL_CACHE_REDIS", "False").lower() == "true"
+PRINCIPAL_CACHE_REDIS_TTL = int(os.getenv("PRINCIPAL_CACHE_REDIS_TTL", "300"))
+PRINCIPAL_PREFIX = "principal:"
+
+
+class Principal(NamedTuple):
+    id: int
+    role: UserRole
+
+
+PrincipalLoader = Callable[[], Awaitable[Optional[Principal]]]
+
+
+class PrincipalCache:
+    """
+    Кэш данных пользователя, нужных для аутентификации: LRU в памяти воркера
+    с коротким TTL и, при PRINCIPAL_CACHE_REDIS, общий уровень в Redis.
+    Записи не сбрасываются явно, а только истекают: в приложении нет путей,
+    меняющих пользователя, поэтому устаревание ограничено PRINCIPAL_CACHE_TTL
+    (и PRINCIPAL_CACHE_REDIS_TTL для общего уровня). Проверки ролей для
+    авторизации кэш не используют.
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL,
+                 use_redis: bool = PRINCIPAL_CACHE_REDIS, redis_ttl: int = PRINCIPAL_CACHE_REDIS_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self.redis_ttl = redis_ttl
+        self.entries: "OrderedDict[int, Tuple[float, Principal]]" = OrderedDict()
+        self.redis_service: Optional[RedisService] = None
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"{PRINCIPAL_PREFIX}{user_id}"
+
+    async def start(self, pool: redis.ConnectionPool):
+        if self.use_redis:
+            self.redis_service = RedisService(pool)
+        logger.info(f"Principal cache started: redis={self.use_redis}")
+
+    async def stop(self):
+        self.redis_service = None
+        self.entries.clear()
+        logger.info("Principal cache stopped")
+
+    async def get(self, user_id: int, loader: PrincipalLoader) -> Optional[Principal]:
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            expires_at, principal = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(user_id)
+                return principal
+            del self.entries[user_id]
+
+        principal = await self._get_shared(user_id)
+        if principal is None:
+            principal = await loader()
+            if principal is None:
+                return None
+            await self._set_shared(principal)
+        self._set_local(principal)
+        return principal
+
+    async def _get_shared(self, user_id: int) -> Optional[Principal]:
+        if not self.use_redis or self.redis_service is None:
+            return None
+        try:
+            cached = await self.redis_service.get_value(self.key(user_id))
+        except Exception as e:
+            logger.error(f"Principal cache read error for user {user_id}: {str(e)}")
+            return None
+        if cached is None:
+            return None
+        data = json.loads(cached)
+        return Principal(id=data["id"], role=UserRole(data["role"]))
+
+    async def _set_shared(self, principal: Principal):
+        if not self.use_redis or self.redis_service is None:
+            return
+        try:
+            await self.redis_service.set_value(
+                self.key(principal.id),
+                json.dumps({"id": principal.id, "role": principal.role.value}),
+                self.redis_ttl
+            )
+        except Exception as e:
+            logger.error(f"Principal cache write error for user {principal.id}: {str(e)}")
+
+    def _set_local(self, principal: Principal):
+        if self.max_size <= 0:
+            return
+        self.entries[principal.id] = (time.monotonic() + self.ttl, principal)
+        self.entries.move_to_end(principal.id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+principal_cache = PrincipalCache()
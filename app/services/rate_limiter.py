@@ -0,0 +1,93 @@
+from app.services.redis_service import RedisService
+from prometheus_client import Counter
+from fastapi import HTTPException
+from typing import NamedTuple, Optional
+import redis.asyncio as redis
+import math
+import uuid
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_PREFIX = "ratelimit:"
+
+rate_limit_rejections_total = Counter(
+    'rate_limit_rejections_total', 'Requests rejected by a sliding-window rate limit', ['rule']
+)
+
+
+class RateLimitRule(NamedTuple):
+    name: str
+    limit: int
+    window: int
+
+
+LOGIN_IP_RULE = RateLimitRule(
+    "login_ip",
+    int(os.getenv("LOGIN_RATE_LIMIT_IP", "20")),
+    int(os.getenv("LOGIN_RATE_LIMIT_WINDOW", "300"))
+)
+LOGIN_ACCOUNT_RULE = RateLimitRule(
+    "login_account",
+    int(os.getenv("LOGIN_RATE_LIMIT_ACCOUNT", "5")),
+    int(os.getenv("LOGIN_RATE_LIMIT_WINDOW", "300"))
+)
+REGISTER_IP_RULE = RateLimitRule(
+    "register_ip",
+    int(os.getenv("REGISTER_RATE_LIMIT_IP", "10")),
+    int(os.getenv("REGISTER_RATE_LIMIT_WINDOW", "3600"))
+)
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты на скользящем окне в Redis. Отклонённые попытки
+    в окно не записываются, а при недоступности Redis запрос пропускается.
+    """
+
+    def __init__(self):
+        self.redis_service: Optional[RedisService] = None
+
+    async def start(self, pool: redis.ConnectionPool):
+        self.redis_service = RedisService(pool)
+
+    async def stop(self):
+        self.redis_service = None
+
+    @staticmethod
+    def key(rule: RateLimitRule, identity: str) -> str:
+        return f"{RATE_LIMIT_PREFIX}{rule.name}:{identity}"
+
+    async def hit(self, rule: RateLimitRule, identity: str):
+        """
+        Учитывает попытку или отклоняет её с 429 и заголовком Retry-After.
+        """
+        if self.redis_service is None or rule.limit <= 0:
+            return
+        try:
+            allowed, retry_after_ms = await self.redis_service.sliding_window_hit(
+                self.key(rule, identity), rule.limit, rule.window * 1000, uuid.uuid4().hex
+            )
+        except Exception as e:
+            logger.error(f"Rate limiter error for {rule.name}: {str(e)}")
+            return
+        if not allowed:
+            rate_limit_rejections_total.labels(rule=rule.name).inc()
+            logger.warning(f"Rate limit {rule.name} exceeded for {identity}")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after_ms / 1000)))}
+            )
+
+    async def reset(self, rule: RateLimitRule, identity: str):
+        if self.redis_service is None:
+            return
+        try:
+            await self.redis_service.delete_value(self.key(rule, identity))
+        except Exception as e:
+            logger.error(f"Failed to reset rate limit {rule.name}: {str(e)}")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,120 @@
+from app.config import async_session, is_statement_error
+from app.repositories.read_state_repository import ReadStateRepository
+from app.repositories.chat_repository import ChatRepository
+from app.services.connection_manager import connection_manager
+from app.schemas.message import ReadUpToEvent
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+READ_FLUSH_INTERVAL_MS = int(os.getenv("READ_FLUSH_INTERVAL_MS", "500"))
+
+
+class ReadReceiptBuffer:
+    def __init__(self, flush_interval: float = READ_FLUSH_INTERVAL_MS / 1000):
+        self.flush_interval = flush_interval
+        self.pending: Dict[Tuple[int, int], int] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+
+    def mark_read_up_to(self, chat_id: int, user_id: int, message_id: int):
+        """
+        Сдвигает watermark пользователя в чате. Запись в БД и рассылка
+        происходят один раз за окно flush_interval.
+        """
+        key = (chat_id, user_id)
+        if message_id > self.pending.get(key, 0):
+            self.pending[key] = message_id
+
+    async def start(self):
+        self.flush_task = asyncio.create_task(self._run())
+        logger.info("Read receipt buffer started")
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+        logger.info("Read receipt buffer stopped")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        try:
+            async with async_session() as session:
+                last_message_ids = await ChatRepository(session).get_last_message_ids(
+                    sorted({chat_id for chat_id, _ in pending})
+                )
+        except Exception as e:
+            logger.error(f"Failed to load last messages for {len(pending)} read watermarks: {str(e)}")
+            self._requeue(pending)
+            return
+        # Watermark не может опережать последнее сообщение чата; отметки в
+        # чатах без сообщений отбрасываются.
+        pending = {
+            (chat_id, user_id): min(message_id, last_message_ids[chat_id])
+            for (chat_id, user_id), message_id in pending.items()
+            if chat_id in last_message_ids
+        }
+        now = datetime.utcnow()
+        watermarks = [
+            {"user_id": user_id, "chat_id": chat_id, "last_read_message_id": message_id, "updated_at": now}
+            for (chat_id, user_id), message_id in sorted(pending.items(), key=lambda item: (item[0][1], item[0][0]))
+        ]
+        try:
+            written = await self._write(watermarks)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(watermarks)} read watermarks: {str(e)}")
+            self._requeue(pending)
+            return
+        logger.debug(f"Flushed {len(written)} of {len(watermarks)} read watermarks")
+
+        for watermark in written:
+            chat_id, user_id, message_id = watermark["chat_id"], watermark["user_id"], watermark["last_read_message_id"]
+            await connection_manager.publish(
+                chat_id, ReadUpToEvent(chat_id=chat_id, user_id=user_id, message_id=message_id).model_dump_json()
+            )
+
+    async def _write(self, watermarks: List[dict]) -> List[dict]:
+        """
+        Записывает пачку watermark'ов. Если БД отвергла данные, пачка делится
+        пополам, и некорректная строка отбрасывается, не блокируя остальные.
+        Ошибки соединения пробрасываются: тогда пачка повторяется целиком.
+        """
+        try:
+            async with async_session() as session:
+                await ReadStateRepository(session).upsert_watermarks(watermarks)
+            return watermarks
+        except Exception as e:
+            if not is_statement_error(e):
+                raise
+            if len(watermarks) == 1:
+                logger.error(f"Dropping read watermark {watermarks[0]}: {str(e)}")
+                return []
+            logger.warning(f"Failed to flush {len(watermarks)} read watermarks, splitting batch: {str(e)}")
+        middle = len(watermarks) // 2
+        return await self._write(watermarks[:middle]) + await self._write(watermarks[middle:])
+
+    def _requeue(self, pending: Dict[Tuple[int, int], int]):
+        for key, message_id in pending.items():
+            if message_id > self.pending.get(key, 0):
+                self.pending[key] = message_id
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Read receipt flush error: {str(e)}")
+
+
+read_receipt_buffer = ReadReceiptBuffer()
@@ -1,38 +1,222 @@
 import redis.asyncio as redis
 from fastapi import HTTPException
 import os
-from datetime import timedelta
+from typing import List, Optional, Set, Tuple
+import hashlib
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+BLACKLIST_PREFIX = "blacklist:"
+TOKEN_REVOCATION_CHANNEL = "token_revocations"
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+PUBLISH_EVENT_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'frame', ARGV[1])
+redis.call('PUBLISH', KEYS[2], '{"event_id":"' .. id .. '",' .. string.sub(ARGV[1], 2))
+return id
+"""
+
+# unpack() всего ARGV упирается в лимит стека Lua (~8000 значений),
+# поэтому элементы множества передаются в SADD/SREM порциями.
+APPLY_CHUNKED = """
+local function apply_chunked(command, key, first)
+    for i = first, #ARGV, 1000 do
+        redis.call(command, key, unpack(ARGV, i, math.min(i + 999, #ARGV)))
+    end
+end
+"""
+
+LOAD_SET_SCRIPT = APPLY_CHUNKED + """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+apply_chunked('SADD', KEYS[1], 3)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+UPDATE_SET_SCRIPT = APPLY_CHUNKED + """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    apply_chunked(ARGV[1], KEYS[1], 3)
+end
+return 1
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms - window)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, tonumber(oldest[2]) + window - now_ms}
+end
+redis.call('ZADD', KEYS[1], now_ms, ARGV[3])
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, 0}
+"""
+
+# ARGV: скорость пополнения (токенов в мс), ёмкость, стоимость запроса.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now_ms
+tokens = math.min(capacity, tokens + math.max(0, now_ms - updated_at) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now_ms)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate) + 1000)
+return {allowed, retry_after}
+"""
+
 class RedisService:
     def __init__(self, pool: redis.ConnectionPool):
         self.pool = pool
         self.client = redis.Redis(connection_pool=pool)
+        # Скрипты регистрируются один раз: вызов идёт через EVALSHA по
+        # заранее посчитанному хэшу, без повторного хэширования исходника.
+        self.publish_event_script = self.client.register_script(PUBLISH_EVENT_SCRIPT)
+        self.load_set_script = self.client.register_script(LOAD_SET_SCRIPT)
+        self.update_set_script = self.client.register_script(UPDATE_SET_SCRIPT)
+        self.sliding_window_script = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+        self.token_bucket_script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
         logger.debug("RedisService initialized with connection pool")
 
-    async def add_to_blacklist(self, token: str, expire_minutes: int):
+    async def add_to_blacklist(self, token_id: str, expire_seconds: int, digest: Optional[str] = None):
         """
-        Добавляет токен в чёрный список с TTL.
+        Добавляет id токена (jti или хэш токена) в чёрный список с TTL и в той
+        же транзакции рассылает его воркерам: они пополняют локальный список
+        отозванных токенов и удаляют токен из кэша проверенных.
         """
-        logger.debug(f"Adding token to blacklist: {token[:10]}...")
-        await self.client.setex(
-            name=f"blacklist:{token}",
-            time=timedelta(minutes=expire_minutes),
-            value="1"
-        )
+        logger.debug(f"Adding token to blacklist: {token_id}")
+        revocation = json.dumps({"id": token_id, "digest": digest or token_id, "ttl": expire_seconds})
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.setex(name=f"{BLACKLIST_PREFIX}{token_id}", time=expire_seconds, value="1")
+            pipe.publish(TOKEN_REVOCATION_CHANNEL, revocation)
+            await pipe.execute()
         logger.debug("Token added to blacklist")
 
-    async def is_blacklisted(self, token: str) -> bool:
+    async def is_blacklisted(self, token_id: str) -> bool:
         """
-        Проверяет, находится ли токен в чёрном списке.
+        Проверяет, находится ли id токена в чёрном списке.
         """
-        logger.debug(f"Checking blacklist for token: {token[:10]}...")
-        result = await self.client.exists(f"blacklist:{token}") > 0
+        logger.debug(f"Checking blacklist for token: {token_id}")
+        result = await self.client.exists(f"{BLACKLIST_PREFIX}{token_id}") > 0
         logger.debug(f"Token blacklisted: {result}")
         return result
 
+    async def get_blacklist(self) -> List[Tuple[str, int]]:
+        """
+        Возвращает все id из чёрного списка с оставшимся TTL в секундах.
+        """
+        keys = [key async for key in self.client.scan_iter(match=f"{BLACKLIST_PREFIX}*", count=1000)]
+        if not keys:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.ttl(key)
+            ttls = await pipe.execute()
+        return [(key[len(BLACKLIST_PREFIX):], ttl) for key, ttl in zip(keys, ttls) if ttl > 0]
+
+    async def publish(self, channel: str, message: str) -> int:
+        """
+        Публикует сообщение в канал pub/sub.
+        """
+        logger.debug(f"Publishing to channel: {channel}")
+        return await self.client.publish(channel, message)
+
+    async def publish_event(self, stream: str, channel: str, frame: str, maxlen: int) -> str:
+        """
+        Атомарно добавляет JSON-кадр в ограниченный stream и публикует его
+        в канал с полем event_id, равным id записи в stream.
+        """
+        return await self.publish_event_script(keys=[stream, channel], args=[frame, maxlen])
+
+    async def read_events(self, stream: str, after_id: str, count: int) -> List[Tuple[str, str]]:
+        """
+        Возвращает кадры из stream, добавленные после after_id.
+        """
+        entries = await self.client.xrange(stream, min=f"({after_id}", max="+", count=count)
+        return [(event_id, fields["frame"]) for event_id, fields in entries]
+
+    async def first_event_id(self, stream: str) -> Optional[str]:
+        entries = await self.client.xrange(stream, min="-", max="+", count=1)
+        return entries[0][0] if entries else None
+
+    async def get_value(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def set_value(self, key: str, value: str, ttl: int):
+        await self.client.setex(name=key, time=ttl, value=value)
+
+    async def delete_value(self, key: str):
+        await self.client.delete(key)
+
+    async def get_generation(self, key: str) -> str:
+        return await self.client.get(key) or "0"
+
+    async def get_set(self, key: str) -> Set[str]:
+        return await self.client.smembers(key)
+
+    async def check_set(self, key: str, *values: str) -> List[bool]:
+        return [bool(found) for found in await self.client.smismember(key, list(values))]
+
+    async def load_set(self, key: str, generation_key: str, generation: str, members: List[str], ttl: int) -> bool:
+        """
+        Заполняет множество целиком, если с момента чтения generation оно
+        не менялось. Иначе данные могли устареть, и множество не пишется.
+        """
+        return bool(await self.load_set_script(keys=[key, generation_key], args=[generation, ttl, *members]))
+
+    async def update_set(self, key: str, generation_key: str, command: str, members: List[str], ttl: int):
+        """
+        Атомарно увеличивает generation и применяет SADD/SREM, только если
+        множество уже загружено.
+        """
+        await self.update_set_script(keys=[key, generation_key], args=[command, ttl, *members])
+
+    async def sliding_window_hit(self, key: str, limit: int, window_ms: int, member: str) -> Tuple[bool, int]:
+        """
+        Учитывает попытку в скользящем окне, если лимит не исчерпан.
+        Возвращает признак допуска и время в мс до освобождения места в окне.
+        """
+        allowed, retry_after_ms = await self.sliding_window_script(keys=[key], args=[limit, window_ms, member])
+        return bool(allowed), int(retry_after_ms)
+
+    async def token_bucket_take(self, key: str, rate: float, capacity: int, cost: int = 1) -> Tuple[bool, int]:
+        """
+        Списывает cost токенов из ведра, пополняемого со скоростью rate в секунду.
+        Возвращает признак допуска и время в мс до появления нужных токенов.
+        """
+        allowed, retry_after_ms = await self.token_bucket_script(keys=[key], args=[repr(rate / 1000), capacity, cost])
+        return bool(allowed), int(retry_after_ms)
+
+    def pubsub(self):
+        """
+        Создаёт объект pub/sub на общем пуле соединений.
+        """
+        return self.client.pubsub(ignore_subscribe_messages=True)
+
     @staticmethod
     async def close_pool(pool: redis.ConnectionPool):
         """
@@ -0,0 +1,243 @@
+from app.config import async_session
+from app.repositories.refresh_token_repository import RefreshTokenRepository
+from app.services.redis_service import RedisService, token_digest
+from app.models.models import RefreshToken
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from abc import ABC, abstractmethod
+import redis.asyncio as redis
+import asyncio
+import uuid
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_STORE = os.getenv("REFRESH_TOKEN_STORE", "postgres").lower()
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+REFRESH_TOKEN_PURGE_INTERVAL = int(os.getenv("REFRESH_TOKEN_PURGE_INTERVAL", "600"))
+REFRESH_TOKEN_PURGE_BATCH = int(os.getenv("REFRESH_TOKEN_PURGE_BATCH", "1000"))
+REFRESH_PREFIX = "refresh:"
+REFRESH_USER_PREFIX = "refresh_user:"
+
+# KEYS: старый токен, новый токен. ARGV: TTL, префикс множества пользователя,
+# дайджест старого и нового токена.
+ROTATE_REFRESH_SCRIPT = """
+local user_id = redis.call('GET', KEYS[1])
+if not user_id then
+    return false
+end
+local user_key = ARGV[2] .. user_id
+redis.call('DEL', KEYS[1])
+redis.call('SET', KEYS[2], user_id, 'EX', ARGV[1])
+redis.call('SREM', user_key, ARGV[3])
+redis.call('SADD', user_key, ARGV[4])
+redis.call('EXPIRE', user_key, ARGV[1])
+return user_id
+"""
+
+REVOKE_USER_REFRESH_SCRIPT = """
+local digests = redis.call('SMEMBERS', KEYS[1])
+for _, digest in ipairs(digests) do
+    redis.call('DEL', ARGV[1] .. digest)
+end
+redis.call('DEL', KEYS[1])
+return #digests
+"""
+
+
+class RefreshTokenStore(ABC):
+    """
+    Хранилище refresh-токенов. Токен одноразовый: rotate() атомарно
+    заменяет его новым.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)):
+        self.ttl = ttl
+
+    async def start(self, pool: redis.ConnectionPool):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def create(self, user_id: int) -> str:
+        ...
+
+    @abstractmethod
+    async def get_user_id(self, token: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def rotate(self, token: str) -> Optional[Tuple[int, str]]:
+        ...
+
+    @abstractmethod
+    async def revoke(self, token: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def revoke_all(self, user_id: int) -> int:
+        ...
+
+    @staticmethod
+    def generate() -> str:
+        return str(uuid.uuid4())
+
+
+class RedisRefreshTokenStore(RefreshTokenStore):
+    """
+    Токены хранятся в Redis под хэшем с нативным TTL; множество хэшей на
+    пользователя позволяет отозвать все его сессии одной операцией.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)):
+        super().__init__(ttl)
+        self.client: Optional[redis.Redis] = None
+        self.rotate_script = None
+        self.revoke_user_script = None
+
+    @staticmethod
+    def key(token: str) -> str:
+        return f"{REFRESH_PREFIX}{token_digest(token)}"
+
+    @staticmethod
+    def user_key(user_id: int) -> str:
+        return f"{REFRESH_USER_PREFIX}{user_id}"
+
+    async def start(self, pool: redis.ConnectionPool):
+        self.client = RedisService(pool).client
+        self.rotate_script = self.client.register_script(ROTATE_REFRESH_SCRIPT)
+        self.revoke_user_script = self.client.register_script(REVOKE_USER_REFRESH_SCRIPT)
+        logger.info("Redis refresh token store started")
+
+    async def stop(self):
+        self.client = None
+        self.rotate_script = None
+        self.revoke_user_script = None
+
+    async def create(self, user_id: int) -> str:
+        token = self.generate()
+        ttl = int(self.ttl.total_seconds())
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self.key(token), user_id, ex=ttl)
+            pipe.sadd(self.user_key(user_id), token_digest(token))
+            pipe.expire(self.user_key(user_id), ttl)
+            await pipe.execute()
+        return token
+
+    async def get_user_id(self, token: str) -> Optional[int]:
+        user_id = await self.client.get(self.key(token))
+        return int(user_id) if user_id is not None else None
+
+    async def rotate(self, token: str) -> Optional[Tuple[int, str]]:
+        new_token = self.generate()
+        user_id = await self.rotate_script(
+            keys=[self.key(token), self.key(new_token)],
+            args=[int(self.ttl.total_seconds()), REFRESH_USER_PREFIX, token_digest(token), token_digest(new_token)]
+        )
+        if user_id is None:
+            return None
+        return int(user_id), new_token
+
+    async def revoke(self, token: str) -> bool:
+        user_id = await self.get_user_id(token)
+        if user_id is None:
+            return False
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key(token))
+            pipe.srem(self.user_key(user_id), token_digest(token))
+            deleted, _ = await pipe.execute()
+        return bool(deleted)
+
+    async def revoke_all(self, user_id: int) -> int:
+        return await self.revoke_user_script(keys=[self.user_key(user_id)], args=[REFRESH_PREFIX])
+
+
+class PostgresRefreshTokenStore(RefreshTokenStore):
+    """
+    Токены хранятся в таблице refresh_tokens; фоновая задача удаляет
+    истёкшие строки пачками.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+                 purge_interval: float = REFRESH_TOKEN_PURGE_INTERVAL, purge_batch: int = REFRESH_TOKEN_PURGE_BATCH):
+        super().__init__(ttl)
+        self.purge_interval = purge_interval
+        self.purge_batch = purge_batch
+        self.purge_task: Optional[asyncio.Task] = None
+
+    async def start(self, pool: redis.ConnectionPool):
+        self.purge_task = asyncio.create_task(self._run_purge())
+        logger.info("Postgres refresh token store started")
+
+    async def stop(self):
+        if self.purge_task:
+            self.purge_task.cancel()
+            try:
+                await self.purge_task
+            except asyncio.CancelledError:
+                pass
+            self.purge_task = None
+
+    async def create(self, user_id: int) -> str:
+        token = self.generate()
+        async with async_session() as session:
+            await RefreshTokenRepository(session).create(
+                RefreshToken(user_id=user_id, token=token, expires_at=datetime.utcnow() + self.ttl)
+            )
+        return token
+
+    async def get_user_id(self, token: str) -> Optional[int]:
+        async with async_session() as session:
+            refresh_token = await RefreshTokenRepository(session).get_active(token)
+        return refresh_token.user_id if refresh_token else None
+
+    async def rotate(self, token: str) -> Optional[Tuple[int, str]]:
+        new_token = self.generate()
+        async with async_session() as session:
+            user_id = await RefreshTokenRepository(session).rotate(token, new_token, datetime.utcnow() + self.ttl)
+        if user_id is None:
+            return None
+        return user_id, new_token
+
+    async def revoke(self, token: str) -> bool:
+        async with async_session() as session:
+            return await RefreshTokenRepository(session).delete_by_token(token)
+
+    async def revoke_all(self, user_id: int) -> int:
+        async with async_session() as session:
+            return await RefreshTokenRepository(session).delete_by_user(user_id)
+
+    async def purge_expired(self) -> int:
+        purged = 0
+        while True:
+            async with async_session() as session:
+                deleted = await RefreshTokenRepository(session).purge_expired(self.purge_batch)
+            purged += deleted
+            if deleted < self.purge_batch:
+                return purged
+
+    async def _run_purge(self):
+        while True:
+            try:
+                purged = await self.purge_expired()
+                if purged:
+                    logger.info(f"Purged {purged} expired refresh tokens")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to purge expired refresh tokens: {str(e)}")
+            await asyncio.sleep(self.purge_interval)
+
+
+def create_refresh_token_store(kind: str = REFRESH_TOKEN_STORE) -> RefreshTokenStore:
+    if kind == "redis":
+        return RedisRefreshTokenStore()
+    if kind == "postgres":
+        return PostgresRefreshTokenStore()
+    raise ValueError(f"Unsupported refresh token store: {kind}")
+
+
+refresh_token_store = create_refresh_token_store()
@@ -0,0 +1,159 @@
+from app.services.redis_service import RedisService, TOKEN_REVOCATION_CHANNEL, token_digest
+from collections import OrderedDict
+from jose import jwt
+from typing import Dict, Optional, Tuple
+import redis.asyncio as redis
+import asyncio
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
+ALGORITHM = "HS256"
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", "300"))
+REVOKED_PRUNE_INTERVAL = 60
+
+
+class TokenCache:
+    """
+    LRU-кэш проверенных JWT: повторный запрос с тем же токеном не проверяет
+    подпись заново. Запись живёт не дольше TTL и не дольше exp токена и
+    удаляется на всех воркерах при занесении токена в чёрный список.
+
+    Там же хранится локальная копия чёрного списка: при старте она читается
+    из Redis и затем пополняется из канала отзыва, поэтому проверка
+    неотозванного токена не требует обращения к сети.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL,
+                 secret_key: str = SECRET_KEY, algorithm: str = ALGORITHM):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.revoked: Dict[str, float] = {}
+        self.redis_service: Optional[RedisService] = None
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def token_id(token: str, claims: dict) -> str:
+        return claims.get("jti") or token_digest(token)
+
+    async def start(self, pool: redis.ConnectionPool):
+        self.redis_service = RedisService(pool)
+        self.pubsub = self.redis_service.pubsub()
+        await self.pubsub.subscribe(TOKEN_REVOCATION_CHANNEL)
+        await self._load_revoked()
+        self.listener_task = asyncio.create_task(self._listen())
+        logger.info(f"Token cache started with {len(self.revoked)} revoked tokens")
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            try:
+                await self.listener_task
+            except asyncio.CancelledError:
+                pass
+            self.listener_task = None
+        if self.pubsub:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        self.redis_service = None
+        self.entries.clear()
+        self.revoked.clear()
+        logger.info("Token cache stopped")
+
+    def decode(self, token: str) -> dict:
+        """
+        Возвращает claims токена. Подпись и exp проверяются только при промахе;
+        ошибки проверки пробрасываются как JWTError.
+        """
+        digest = token_digest(token)
+        entry = self.entries.get(digest)
+        if entry is not None:
+            expires_at, claims = entry
+            if expires_at > time.time():
+                self.entries.move_to_end(digest)
+                return claims
+            del self.entries[digest]
+
+        claims = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+        expires_at = time.time() + self.ttl
+        if "exp" in claims:
+            expires_at = min(expires_at, float(claims["exp"]))
+        if self.max_size > 0:
+            self.entries[digest] = (expires_at, claims)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return claims
+
+    def is_revoked(self, token: str, claims: dict) -> bool:
+        expires_at = self.revoked.get(self.token_id(token, claims))
+        return expires_at is not None and expires_at > time.time()
+
+    async def revoke(self, token: str, claims: dict, default_ttl: int):
+        """
+        Отзывает токен до истечения его exp: сразу на этом воркере и через
+        Redis на остальных.
+        """
+        ttl = int(claims["exp"] - time.time()) + 1 if "exp" in claims else default_ttl
+        token_id = self.token_id(token, claims)
+        digest = token_digest(token)
+        self._mark_revoked(token_id, digest, max(ttl, 1))
+        if self.redis_service is not None:
+            await self.redis_service.add_to_blacklist(token_id, max(ttl, 1), digest)
+
+    def evict(self, digest: str):
+        self.entries.pop(digest, None)
+
+    def _mark_revoked(self, token_id: str, digest: str, ttl: int):
+        self.revoked[token_id] = time.time() + ttl
+        self.evict(digest)
+
+    def _prune_revoked(self):
+        now = time.time()
+        self.revoked = {token_id: expires_at for token_id, expires_at in self.revoked.items() if expires_at > now}
+
+    async def _load_revoked(self):
+        for token_id, ttl in await self.redis_service.get_blacklist():
+            self.revoked[self._stored_token_id(token_id)] = time.time() + ttl
+
+    @staticmethod
+    def _stored_token_id(stored_id: str) -> str:
+        """
+        До перехода на jti в чёрный список писался сам JWT. У таких токенов
+        нет jti, поэтому они ищутся по хэшу.
+        """
+        return token_digest(stored_id) if stored_id.count(".") == 2 else stored_id
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        pruned_at = loop.time()
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if loop.time() - pruned_at > REVOKED_PRUNE_INTERVAL:
+                    self._prune_revoked()
+                    pruned_at = loop.time()
+                if message is None or message["type"] != "message":
+                    continue
+                revocation = json.loads(message["data"])
+                self._mark_revoked(revocation["id"], revocation["digest"], revocation["ttl"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token revocation listener error: {str(e)}")
+                await asyncio.sleep(1.0)
+                # Отзывы, опубликованные во время обрыва, могли потеряться.
+                try:
+                    await self._load_revoked()
+                except Exception as e:
+                    logger.error(f"Failed to reload token blacklist: {str(e)}")
+
+token_cache = TokenCache()
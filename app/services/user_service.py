@@ -1,18 +1,16 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.repositories.user_repository import UserRepository
 from app.schemas.user import UserCreate, UserResponse, UserRole
-from app.models.models import User, RefreshToken
+from app.models.models import User
+from app.services.principal_cache import Principal, principal_cache
+from app.services.password_hasher import password_hasher
+from app.services.refresh_token_store import refresh_token_store
 from fastapi import HTTPException
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from jose import jwt
-import uuid
-import os
+from typing import Optional, Tuple
 
 class UserService:
     def __init__(self, session: AsyncSession):
         self.user_repo = UserRepository(session)
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
         self.session = session
 
     async def create_user(self, user_data: UserCreate) -> UserResponse:
@@ -26,7 +24,7 @@ class UserService:
         user = User(
             name=user_data.name,
             email=user_data.email,
-            password=self.pwd_context.hash(user_data.password),
+            password=await password_hasher.hash(user_data.password),
             role=user_data.role
         )
         created_user = await self.user_repo.create(user)
@@ -38,6 +36,15 @@ class UserService:
             raise HTTPException(status_code=404, detail="User not found")
         return UserResponse.model_validate(user)
 
+    async def get_principal(self, user_id: int) -> Optional[Principal]:
+        return await principal_cache.get(user_id, lambda: self._load_principal(user_id))
+
+    async def _load_principal(self, user_id: int) -> Optional[Principal]:
+        user = await self.user_repo.get_by_id(user_id)
+        if not user:
+            return None
+        return Principal(id=user.id, role=UserRole(user.role.value))
+
     async def get_user_by_email(self, email: str) -> UserResponse:
         user = await self.user_repo.get_by_email(email)
         if not user:
@@ -46,41 +53,40 @@ class UserService:
 
     async def authenticate_user(self, email: str, password: str) -> User:
         user = await self.user_repo.get_by_email(email)
-        if not user or not self.pwd_context.verify(password, user.password):
+        if not user:
             return None
+        verified, new_hash = await password_hasher.verify_and_update(password, user.password)
+        if not verified:
+            return None
+        if new_hash:
+            user.password = new_hash
+            await self.session.commit()
         return user
 
     async def create_refresh_token(self, user_id: int) -> str:
-        refresh_token_expires = timedelta(days=int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7")))
-        expires_at = datetime.utcnow() + refresh_token_expires
-        token = str(uuid.uuid4())
-        refresh_token = RefreshToken(
-            user_id=user_id,
-            token=token,
-            expires_at=expires_at
-        )
-        self.session.add(refresh_token)
-        await self.session.commit()
-        return token
+        return await refresh_token_store.create(user_id)
 
-    async def get_refresh_token(self, token: str) -> RefreshToken:
-        from sqlalchemy import select
-        result = await self.session.execute(
-            select(RefreshToken).filter(RefreshToken.token == token)
-        )
-        refresh_token = result.scalars().first()
-        if not refresh_token or refresh_token.expires_at < datetime.utcnow():
+    async def rotate_refresh_token(self, token: str) -> Tuple[int, str]:
+        """
+        Обменивает refresh-токен на новый. Повторно использовать старый
+        токен нельзя.
+        """
+        rotated = await refresh_token_store.rotate(token)
+        if rotated is None:
             raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
-        return refresh_token
+        return rotated
 
     async def delete_refresh_token(self, token: str):
-        refresh_token = await self.get_refresh_token(token)
-        await self.session.delete(refresh_token)
-        await self.session.commit()
-
-    async def check_user_role(self, user_id: int, required_role: UserRole) -> bool:
-
+        if not await refresh_token_store.revoke(token):
+            raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
 
+    async def revoke_all_refresh_tokens(self, user_id: int) -> int:
+        return await refresh_token_store.revoke_all(user_id)
 
-        user = await self.get_user_by_id(user_id)
-        return user.role == required_role
\ No newline at end of file
+    async def check_user_role(self, user_id: int, required_role: UserRole) -> bool:
+        # Роль для авторизации читается из БД, а не из кэша принципалов:
+        # понижение роли должно действовать сразу, а не через TTL кэша.
+        principal = await self._load_principal(user_id)
+        if principal is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return principal.role == required_role
\ No newline at end of file
@@ -0,0 +1,106 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.repositories.chat_repository import ChatRepository
+from app.services.message_service import MessageService
+from app.services.connection_manager import Connection, connection_manager
+from app.services.read_receipt_service import read_receipt_buffer
+from app.services.message_ingest import message_ingest_pipeline
+from app.services.frame_limiter import frame_rate_limiter
+from app.schemas.message import MessageCreate, MessageEvent, MAX_MESSAGE_ID
+from fastapi import HTTPException
+from pydantic import ValidationError
+from prometheus_client import Counter
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+websocket_invalid_frames_total = Counter(
+    'websocket_invalid_frames_total', 'Inbound WebSocket frames rejected as malformed', ['reason']
+)
+
+
+class WebSocketService:
+    def __init__(self, session: AsyncSession):
+        self.chat_repo = ChatRepository(session)
+        self.message_service = MessageService(session)
+
+    async def authorize_chat(self, chat_id: int, user_id: int):
+        if not await self.chat_repo.get_by_id(chat_id):
+            raise HTTPException(status_code=404, detail="Chat not found")
+        if not await self.chat_repo.is_participant(chat_id, user_id):
+            raise HTTPException(status_code=403, detail="User not in chat")
+
+    async def handle_frame(self, connection: Connection, chat_id: int, user_id: int, data: dict):
+        # Кадр неверной формы отклоняется до ограничителя: его тип нельзя
+        # использовать как ключ правила.
+        if not isinstance(data, dict) or not isinstance(data.get("type"), str):
+            websocket_invalid_frames_total.labels(reason="frame").inc()
+            logger.warning(f"Malformed WebSocket frame from user {user_id}")
+            connection.send_json({"type": "error", "detail": "Invalid frame"})
+            return
+        if chat_id not in connection.chat_ids:
+            logger.warning(f"User {user_id} sent frame to unauthorized chat: {chat_id}")
+            connection.send_json({"type": "error", "chat_id": chat_id, "detail": "Not subscribed to chat"})
+            return
+        frame_type = data.get("type")
+        retry_after = await frame_rate_limiter.acquire(connection, user_id, frame_type)
+        if retry_after > 0:
+            logger.warning(f"User {user_id} exceeded {frame_type} frame rate in chat {chat_id}")
+            connection.send_json({
+                "type": "error", "chat_id": chat_id, "detail": "Rate limit exceeded",
+                "retry_after_ms": math.ceil(retry_after * 1000)
+            })
+            return
+        if frame_type == "message":
+            await self.handle_message(connection, chat_id, user_id, data)
+        elif frame_type in ("read", "read_up_to"):
+            await self.handle_read(connection, chat_id, user_id, data)
+        else:
+            logger.warning(f"Unknown WebSocket frame type: {frame_type}")
+            connection.send_json({"type": "error", "detail": "Unknown frame type"})
+
+    async def handle_message(self, connection: Connection, chat_id: int, user_id: int, data: dict):
+        logger.info(f"New message in chat {chat_id} from user {user_id}")
+        try:
+            message = MessageCreate(
+                chat_id=chat_id,
+                text=data.get("text", "")
+            )
+        except ValidationError:
+            websocket_invalid_frames_total.labels(reason="message").inc()
+            logger.warning(f"Invalid message payload from user {user_id}")
+            connection.send_json({"type": "error", "chat_id": chat_id, "detail": "Invalid message"})
+            return
+        message_uuid = data.get("uuid")
+        if not message_uuid:
+            logger.warning("Message UUID missing")
+            connection.send_json({"type": "error", "detail": "UUID required"})
+            return
+        try:
+            if message_ingest_pipeline.enabled:
+                saved_message, created = await message_ingest_pipeline.submit(
+                    message, user_id, message_uuid, chat_verified=True
+                )
+            else:
+                saved_message, created = await self.message_service.store_message(
+                    message, user_id, message_uuid, chat_verified=True
+                )
+            frame = MessageEvent(message=saved_message).model_dump_json()
+            if not created:
+                logger.debug(f"Duplicate message uuid, returning stored message: {saved_message.id}")
+                connection.send(frame)
+                return
+            logger.debug(f"Message sent: {saved_message.id}")
+            await connection_manager.publish(chat_id, frame)
+        except HTTPException as e:
+            logger.error(f"Failed to send message: {str(e.detail)}")
+            connection.send_json({"type": "error", "detail": str(e.detail)})
+
+    async def handle_read(self, connection: Connection, chat_id: int, user_id: int, data: dict):
+        message_id = data.get("message_id")
+        if isinstance(message_id, bool) or not isinstance(message_id, int) or not 0 < message_id <= MAX_MESSAGE_ID:
+            logger.warning("Message ID missing for read action")
+            connection.send_json({"type": "error", "detail": "Message ID required"})
+            return
+        logger.debug(f"User {user_id} read chat {chat_id} up to message {message_id}")
+        read_receipt_buffer.mark_read_up_to(chat_id, user_id, message_id)
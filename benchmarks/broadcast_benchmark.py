@@ -0,0 +1,67 @@
+"""
+Сравнение стоимости рассылки одного сообщения в чат разного размера:
+валидация и JSON-кодирование на каждого получателя против однократной
+сериализации кадра.
+
+Запуск: python -m benchmarks.broadcast_benchmark
+"""
+from app.schemas.message import MessageEvent, MessageResponse
+from app.services.connection_manager import Connection
+from datetime import datetime
+import asyncio
+import json
+import time
+
+GROUP_SIZES = [10, 100, 500, 1000, 2000, 5000]
+ROUNDS = 20
+
+
+class NullWebSocket:
+    async def send_text(self, frame):
+        pass
+
+    async def send_json(self, payload):
+        json.dumps(payload)
+
+
+def make_message() -> MessageResponse:
+    return MessageResponse(
+        id=1, chat_id=1, sender_id=1, text="x" * 200, timestamp=datetime.utcnow(), is_read=False
+    )
+
+
+def per_recipient(message: MessageResponse, connections):
+    for _ in connections:
+        payload = {
+            "type": "message",
+            "message": MessageResponse.model_validate(message).model_dump(mode="json")
+        }
+        json.dumps(payload)
+
+
+def serialize_once(message: MessageResponse, connections):
+    frame = MessageEvent(message=message).model_dump_json()
+    for connection in connections:
+        connection.send(frame)
+        connection.queue.get_nowait()
+
+
+def measure(func, message, connections) -> float:
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        func(message, connections)
+    return (time.process_time() - start) / ROUNDS * 1000
+
+
+async def main():
+    message = make_message()
+    print(f"{'group size':>10} {'per-recipient, ms':>18} {'serialize-once, ms':>19} {'speedup':>8}")
+    for size in GROUP_SIZES:
+        connections = [Connection(NullWebSocket(), max_queue_size=1) for _ in range(size)]
+        before = measure(per_recipient, message, connections)
+        after = measure(serialize_once, message, connections)
+        print(f"{size:>10} {before:>18.3f} {after:>19.3f} {before / max(after, 1e-9):>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -35,6 +35,23 @@ async def test_refresh_token(async_client, user):
     assert "refresh_token" not in data
 
 
+@pytest.mark.asyncio
+async def test_refresh_token_rotates_on_use(async_client, user):
+    login_response = await async_client.post(
+        "/auth/token",
+        data={"username": "test@test.com", "password": "password"}
+    )
+    refresh_token = login_response.json()["refresh_token"]
+
+    refresh_response = await async_client.post(f"/auth/refresh?refresh_token={refresh_token}")
+    assert refresh_response.status_code == 200
+    assert refresh_response.json()["refresh_token"] != refresh_token
+
+    reuse_response = await async_client.post(f"/auth/refresh?refresh_token={refresh_token}")
+    assert reuse_response.status_code == 401
+    assert reuse_response.json()["detail"] == "Invalid or expired refresh token"
+
+
 @pytest.mark.asyncio
 async def test_refresh_with_invalid_token(async_client):
     response = await async_client.post(
@@ -96,4 +113,257 @@ async def test_blacklist_token(async_client, user, redis_client):
         headers={"X-CSRF-Token": csrf_token}
     )
     assert chat_response.status_code == 401
-    assert chat_response.json()["detail"] == "Token has been revoked"
\ No newline at end of file
+    assert chat_response.json()["detail"] == "Token has been revoked"
+
+
+def test_token_cache_skips_repeated_verification(monkeypatch):
+    from app.services import token_cache as token_cache_module
+    from app.services.token_cache import TokenCache
+    from app.services.redis_service import token_digest
+    from datetime import datetime, timedelta
+    from jose import jwt
+    import time
+
+    cache = TokenCache(max_size=2, ttl=60, secret_key="secret")
+    token = jwt.encode({"sub": "1", "exp": datetime.utcnow() + timedelta(minutes=5)}, "secret", algorithm="HS256")
+    decode_calls = []
+    original_decode = token_cache_module.jwt.decode
+
+    def counting_decode(*args, **kwargs):
+        decode_calls.append(1)
+        return original_decode(*args, **kwargs)
+
+    monkeypatch.setattr(token_cache_module.jwt, "decode", counting_decode)
+    assert cache.decode(token)["sub"] == "1"
+    assert cache.decode(token)["sub"] == "1"
+    assert len(decode_calls) == 1
+
+    cache.evict(token_digest(token))
+    cache.decode(token)
+    assert len(decode_calls) == 2
+
+    expires_at, claims = cache.entries[token_digest(token)]
+    cache.entries[token_digest(token)] = (time.time() - 1, claims)
+    cache.decode(token)
+    assert len(decode_calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_token_cache_tracks_revocations_locally():
+    from app.services.token_cache import TokenCache
+    from datetime import datetime, timedelta
+    from jose import jwt
+    import asyncio
+    import json
+
+    cache = TokenCache(secret_key="secret")
+    expire = datetime.utcnow() + timedelta(minutes=5)
+    token = jwt.encode({"sub": "1", "exp": expire, "jti": "a1"}, "secret", algorithm="HS256")
+    other = jwt.encode({"sub": "1", "exp": expire, "jti": "b2"}, "secret", algorithm="HS256")
+
+    claims = cache.decode(token)
+    assert not cache.is_revoked(token, claims)
+    await cache.revoke(token, claims, 60)
+    assert cache.is_revoked(token, claims)
+    assert not cache.entries
+
+    class FakePubSub:
+        def __init__(self, messages):
+            self.messages = messages
+
+        async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+            if self.messages:
+                return self.messages.pop(0)
+            raise asyncio.CancelledError
+
+    other_claims = cache.decode(other)
+    cache.pubsub = FakePubSub([
+        {"type": "message", "data": json.dumps({"id": "b2", "digest": "unused", "ttl": 60})}
+    ])
+    with pytest.raises(asyncio.CancelledError):
+        await cache._listen()
+    assert cache.is_revoked(other, other_claims)
+
+    legacy = jwt.encode({"sub": "1", "exp": expire}, "secret", algorithm="HS256")
+
+    class FakeRedisService:
+        async def get_blacklist(self):
+            return [(legacy, 60), ("c3", 60)]
+
+    cache.redis_service = FakeRedisService()
+    await cache._load_revoked()
+    assert cache.is_revoked(legacy, cache.decode(legacy))
+    assert "c3" in cache.revoked
+
+
+def test_auth_middleware_verifies_token_and_csrf_once(monkeypatch):
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    from app.middlewares import auth_middleware
+    from app.middlewares.auth_middleware import AuthMiddleware
+    from app.services.csrf_service import CSRFService
+    from app.services.token_cache import TokenCache
+    from datetime import datetime, timedelta
+    from jose import jwt
+
+    monkeypatch.setattr(auth_middleware, "token_cache", TokenCache(secret_key="secret"))
+    token = jwt.encode({"sub": "1", "exp": datetime.utcnow() + timedelta(minutes=5)}, "secret", algorithm="HS256")
+    csrf_token = CSRFService().generate_csrf_token("1")
+
+    async def endpoint(request):
+        auth = getattr(request.state, "auth", None)
+        return JSONResponse({"sub": auth.claims["sub"] if auth else None})
+
+    app = Starlette(routes=[Route("/items", endpoint, methods=["GET", "POST"])])
+    app.add_middleware(AuthMiddleware)
+    client = TestClient(app)
+
+    response = client.post("/items", cookies={"access_token": token})
+    assert response.status_code == 403
+    assert response.json()["detail"] == "CSRF token missing"
+
+    response = client.post("/items", cookies={"access_token": token}, headers={"X-CSRF-Token": csrf_token})
+    assert response.status_code == 200
+    assert response.json() == {"sub": "1"}
+
+    response = client.get("/items", cookies={"access_token": "garbage"})
+    assert response.status_code == 200
+    assert response.json() == {"sub": None}
+
+
+def test_auth_middleware_lets_register_through_without_csrf():
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+    from app.middlewares.auth_middleware import AuthMiddleware
+
+    async def endpoint(request):
+        return JSONResponse({"ok": True})
+
+    app = Starlette(routes=[
+        Route("/auth/register", endpoint, methods=["POST"]),
+        Route("/items", endpoint, methods=["POST", "DELETE"])
+    ])
+    app.add_middleware(AuthMiddleware)
+    client = TestClient(app)
+
+    response = client.post("/auth/register")
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+
+    response = client.post("/items")
+    assert response.status_code == 401
+    response = client.delete("/items")
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_rejects_with_retry_after():
+    from fastapi import HTTPException
+    from app.services.rate_limiter import RateLimiter, RateLimitRule
+
+    class FakeRedisService:
+        def __init__(self):
+            self.hits = {}
+
+        async def sliding_window_hit(self, key, limit, window_ms, member):
+            self.hits[key] = self.hits.get(key, 0) + 1
+            if self.hits[key] > limit:
+                return False, 1500
+            return True, 0
+
+        async def delete_value(self, key):
+            self.hits.pop(key, None)
+
+    limiter = RateLimiter()
+    limiter.redis_service = FakeRedisService()
+    rule = RateLimitRule("login_account", 2, 60)
+
+    await limiter.hit(rule, "test@test.com")
+    await limiter.hit(rule, "test@test.com")
+    with pytest.raises(HTTPException) as error:
+        await limiter.hit(rule, "test@test.com")
+    assert error.value.status_code == 429
+    assert error.value.headers == {"Retry-After": "2"}
+
+    await limiter.reset(rule, "test@test.com")
+    await limiter.hit(rule, "test@test.com")
+
+
+def test_client_ip_trusts_forwarded_for_only_from_proxies():
+    from starlette.requests import Request
+    from app.controllers.auth_controller import client_ip
+
+    def request(peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "client": (peer, 1234), "headers": headers})
+
+    assert client_ip(request("198.51.100.9", "203.0.113.7")) == "198.51.100.9"
+    assert client_ip(request("127.0.0.1", "10.0.0.1, 203.0.113.7")) == "203.0.113.7"
+    assert client_ip(request("127.0.0.1", "203.0.113.7, 127.0.0.1")) == "203.0.113.7"
+    assert client_ip(request("127.0.0.1")) == "127.0.0.1"
+
+
+@pytest.mark.asyncio
+async def test_login_and_register_are_throttled_before_hashing(async_client, monkeypatch):
+    from app.services.rate_limiter import rate_limiter
+    from app.services.user_service import UserService
+
+    class RejectingRedisService:
+        def __init__(self):
+            self.keys = []
+
+        async def sliding_window_hit(self, key, limit, window_ms, member):
+            self.keys.append(key)
+            return False, 1500
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("rate-limited request reached password hashing")
+
+    redis_service = RejectingRedisService()
+    monkeypatch.setattr(rate_limiter, "redis_service", redis_service)
+    monkeypatch.setattr(UserService, "authenticate_user", unexpected)
+    monkeypatch.setattr(UserService, "create_user", unexpected)
+
+    response = await async_client.post(
+        "/auth/token",
+        data={"username": "test@test.com", "password": "password"},
+        headers={"X-Forwarded-For": "198.51.100.1, 203.0.113.7"}
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+    response = await async_client.post(
+        "/auth/register",
+        json={"name": "Test User", "email": "test@test.com", "password": "password"},
+        headers={"X-Forwarded-For": "203.0.113.7"}
+    )
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert redis_service.keys == ["ratelimit:login_ip:203.0.113.7", "ratelimit:register_ip:203.0.113.7"]
+
+
+@pytest.mark.asyncio
+async def test_redis_service_reuses_registered_scripts(monkeypatch):
+    import redis.asyncio as redis
+    from app.services.redis_service import RedisService, SLIDING_WINDOW_SCRIPT
+
+    service = RedisService(redis.ConnectionPool())
+    assert service.sliding_window_script.script == SLIDING_WINDOW_SCRIPT
+    calls = []
+
+    async def sliding_window_script(keys, args):
+        calls.append(keys)
+        return [1, 0]
+
+    def register_script(script):
+        raise AssertionError("script registered on every call")
+
+    service.sliding_window_script = sliding_window_script
+    monkeypatch.setattr(service.client, "register_script", register_script)
+    for _ in range(3):
+        assert await service.sliding_window_hit("ratelimit:login_ip:1", 5, 1000, "m") == (True, 0)
+    assert calls == [["ratelimit:login_ip:1"]] * 3
@@ -15,4 +15,134 @@ async def test_access_protected_endpoint_with_cookie(async_client, user):
         json={"user1_id": user.id, "user2_id": user.id + 1},
         headers={"X-CSRF-Token": csrf_token}
     )
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+@pytest.mark.asyncio
+async def test_inbox_orders_by_activity_with_unread_counts(db_session, user, async_client, monkeypatch):
+    from app.repositories import chat_repository
+    from app.services.chat_service import ChatService
+    from app.services.message_service import MessageService
+    from app.services.user_service import UserService
+    from app.services.connection_manager import connection_manager
+    from app.services.read_receipt_service import ReadReceiptBuffer
+    from app.schemas.message import MessageCreate
+    from app.schemas.user import UserCreate
+    import uuid
+
+    user_service = UserService(db_session)
+    alice = await user_service.create_user(UserCreate(name="Alice", email="alice@test.com", password="password"))
+    bob = await user_service.create_user(UserCreate(name="Bob", email="bob@test.com", password="password"))
+    chat_service = ChatService(db_session)
+    message_service = MessageService(db_session)
+    older_chat = await chat_service.create_personal_chat(user.id, alice.id)
+    newer_chat = await chat_service.create_personal_chat(user.id, bob.id)
+
+    first = await message_service.send_message(MessageCreate(chat_id=older_chat.id, text="Hi"), alice.id, str(uuid.uuid4()))
+    await message_service.send_message(MessageCreate(chat_id=older_chat.id, text="Hello"), user.id, str(uuid.uuid4()))
+    second = await message_service.send_message(
+        MessageCreate(chat_id=older_chat.id, text="Are you there?"), alice.id, str(uuid.uuid4())
+    )
+    await message_service.send_message(MessageCreate(chat_id=newer_chat.id, text="Ping"), bob.id, str(uuid.uuid4()))
+
+    login_response = await async_client.post(
+        "/auth/token",
+        data={"username": "test@test.com", "password": "password"}
+    )
+    assert login_response.status_code == 200
+
+    response = await async_client.get("/chats/", params={"limit": 1})
+    assert response.status_code == 200
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == [newer_chat.id]
+    assert page["items"][0]["last_message"]["text"] == "Ping"
+    assert page["items"][0]["unread_count"] == 1
+    assert page["next_cursor"] is not None
+
+    response = await async_client.get("/chats/", params={"limit": 1, "cursor": page["next_cursor"]})
+    assert response.status_code == 200
+    page = response.json()
+    assert [item["id"] for item in page["items"]] == [older_chat.id]
+    assert page["items"][0]["last_message"]["text"] == "Are you there?"
+    assert page["items"][0]["unread_count"] == 2
+    assert page["next_cursor"] is None
+
+    monkeypatch.setattr(chat_repository, "UNREAD_COUNT_LIMIT", 1)
+    response = await async_client.get("/chats/")
+    unread = {item["id"]: item["unread_count"] for item in response.json()["items"]}
+    assert unread == {newer_chat.id: 1, older_chat.id: 1}
+    monkeypatch.undo()
+
+    published = []
+
+    async def publish(chat_id, frame):
+        published.append(chat_id)
+
+    monkeypatch.setattr(connection_manager, "publish", publish)
+    buffer = ReadReceiptBuffer()
+    buffer.mark_read_up_to(older_chat.id, user.id, first.id)
+    await buffer.flush()
+    assert published == [older_chat.id]
+
+    response = await async_client.get("/chats/")
+    assert response.status_code == 200
+    unread = {item["id"]: item["unread_count"] for item in response.json()["items"]}
+    assert unread == {newer_chat.id: 1, older_chat.id: 1}
+
+    buffer.mark_read_up_to(older_chat.id, user.id, second.id)
+    await buffer.flush()
+    response = await async_client.get("/chats/")
+    unread = {item["id"]: item["unread_count"] for item in response.json()["items"]}
+    assert unread == {newer_chat.id: 1, older_chat.id: 0}
+
+
+@pytest.mark.asyncio
+async def test_personal_chat_is_unique_per_user_pair(db_session, user):
+    import asyncio
+    from fastapi import HTTPException
+    from sqlalchemy import select, func
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app.models.models import Chat, group_participants
+    from app.repositories.chat_repository import ChatRepository
+    from app.services.chat_service import ChatService
+    from app.services.user_service import UserService
+    from app.schemas.user import UserCreate
+
+    user_service = UserService(db_session)
+    alice = await user_service.create_user(UserCreate(name="Alice", email="alice@test.com", password="password"))
+    bob = await user_service.create_user(UserCreate(name="Bob", email="bob@test.com", password="password"))
+
+    chat_repo = ChatRepository(db_session)
+    chat, created = await chat_repo.get_or_create_personal_chat(alice.id, user.id, name="Chat")
+    assert created
+    same_chat, created = await chat_repo.get_or_create_personal_chat(user.id, alice.id, name="Chat")
+    assert not created
+    assert same_chat.id == chat.id
+    assert (await chat_repo.get_personal_chat(alice.id, user.id)).id == chat.id
+    with pytest.raises(HTTPException) as error:
+        await ChatService(db_session).create_personal_chat(user.id, alice.id)
+    assert error.value.status_code == 400
+
+    session_factory = sessionmaker(db_session.bind, class_=AsyncSession, expire_on_commit=False)
+
+    async def create(user1_id, user2_id):
+        async with session_factory() as session:
+            return await ChatRepository(session).get_or_create_personal_chat(user1_id, user2_id, name="Chat")
+
+    results = await asyncio.gather(*[
+        create(user.id, bob.id) if i % 2 else create(bob.id, user.id) for i in range(8)
+    ])
+    assert sum(created for _, created in results) == 1
+    assert len({chat.id for chat, _ in results}) == 1
+
+    user_low_id, user_high_id = sorted((user.id, bob.id))
+    count = await db_session.scalar(
+        select(func.count()).select_from(Chat).filter(
+            Chat.user_low_id == user_low_id, Chat.user_high_id == user_high_id
+        )
+    )
+    assert count == 1
+    participants = await db_session.scalars(
+        select(group_participants.c.user_id).filter(group_participants.c.group_id == results[0][0].id)
+    )
+    assert sorted(participants.all()) == [user_low_id, user_high_id]
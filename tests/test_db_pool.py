@@ -0,0 +1,40 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_exports_checkout_metrics():
+    from prometheus_client import REGISTRY
+    from sqlalchemy import exc
+    from sqlalchemy.util import greenlet_spawn
+    from app.db_pool import InstrumentedQueuePool
+
+    class FakeConnection:
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name) or 0.0
+
+    waits_before = sample("db_pool_wait_seconds_count")
+    timeouts_before = sample("db_pool_timeouts_total")
+    pool = InstrumentedQueuePool(FakeConnection, pool_size=1, max_overflow=1, timeout=0.01)
+
+    def exhaust_pool():
+        first = pool.connect()
+        second = pool.connect()
+        assert sample("db_pool_size") == 1
+        assert sample("db_pool_checked_out") == 2
+        assert sample("db_pool_overflow") == 1
+        with pytest.raises(exc.TimeoutError):
+            pool.connect()
+        first.close()
+        second.close()
+
+    await greenlet_spawn(exhaust_pool)
+
+    assert sample("db_pool_checked_out") == 0
+    assert sample("db_pool_wait_seconds_count") - waits_before == 3
+    assert sample("db_pool_timeouts_total") - timeouts_before == 1
@@ -70,4 +70,177 @@ async def test_group_add_participant_as_non_admin(async_client, user):
         headers={"X-CSRF-Token": csrf_token}
     )
     assert response.status_code == 403
-    assert response.json()["detail"] == "Only group creator or admin can add participants"
\ No newline at end of file
+    assert response.json()["detail"] == "Only group creator or admin can add participants"
+
+
+@pytest.mark.asyncio
+async def test_group_bulk_add_reports_per_user_outcome(db_session, async_client, admin_user, user, monkeypatch):
+    from app.models.models import Chat, ChatType
+    from app.repositories.chat_repository import ChatRepository
+    from app.repositories.group_repository import GroupRepository
+    from app.services.connection_manager import connection_manager, MEMBERSHIP_ADDED, MEMBERSHIP_REMOVED
+    from app.services.group_service import GroupService
+    from app.services.user_service import UserService
+    from app.schemas.user import UserCreate
+
+    chat = await ChatRepository(db_session).create(Chat(name="Test Group", type=ChatType.GROUP))
+    group = await GroupService(db_session).create_group(chat.id, admin_user.id, "Test Group")
+    member = await UserService(db_session).create_user(
+        UserCreate(name="Member", email="member@test.com", password="password")
+    )
+    group_repo = GroupRepository(db_session)
+    await group_repo.add_participant(group.id, member.id)
+    missing_id = user.id + member.id + 1000
+
+    published = []
+
+    async def publish_membership_change(chat_id, user_ids, action):
+        published.append((chat_id, user_ids, action))
+
+    monkeypatch.setattr(connection_manager, "publish_membership_change", publish_membership_change)
+
+    login_response = await async_client.post(
+        "/auth/token",
+        data={"username": "admin@test.com", "password": "password"}
+    )
+    assert login_response.status_code == 200
+    csrf_token = login_response.json()["csrf_token"]
+
+    response = await async_client.post(
+        f"/chats/group/{group.id}/participants/bulk-add",
+        json={"user_ids": [user.id, missing_id, user.id, member.id]},
+        headers={"X-CSRF-Token": csrf_token}
+    )
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"user_id": user.id, "status": "added"},
+        {"user_id": missing_id, "status": "user_not_found"},
+        {"user_id": member.id, "status": "already_member"}
+    ]
+    assert published == [(chat.id, [user.id], MEMBERSHIP_ADDED)]
+    assert sorted(await group_repo.get_participant_ids(group.id)) == sorted([user.id, member.id])
+
+    published.clear()
+    response = await async_client.post(
+        f"/chats/group/{group.id}/participants/bulk-remove",
+        json={"user_ids": [user.id, missing_id, member.id, user.id]},
+        headers={"X-CSRF-Token": csrf_token}
+    )
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"user_id": user.id, "status": "removed"},
+        {"user_id": missing_id, "status": "not_member"},
+        {"user_id": member.id, "status": "removed"}
+    ]
+    assert published == [(chat.id, sorted([user.id, member.id]), MEMBERSHIP_REMOVED)]
+    assert await group_repo.get_participant_ids(group.id) == []
+
+    published.clear()
+    response = await async_client.post(
+        f"/chats/group/{group.id}/participants/bulk-remove",
+        json={"user_ids": [user.id]},
+        headers={"X-CSRF-Token": csrf_token}
+    )
+    assert response.status_code == 200
+    assert response.json()["results"] == [{"user_id": user.id, "status": "not_member"}]
+    assert published == []
+
+    for action in ("bulk-add", "bulk-remove"):
+        response = await async_client.post(
+            f"/chats/group/{group.id + 1000}/participants/{action}",
+            json={"user_ids": [user.id]},
+            headers={"X-CSRF-Token": csrf_token}
+        )
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Group not found"
+
+
+class FakeSetRedisService:
+    def __init__(self):
+        self.sets = {}
+        self.generations = {}
+
+    async def get_generation(self, key):
+        return str(self.generations.get(key, 0))
+
+    async def get_set(self, key):
+        return set(self.sets.get(key, ()))
+
+    async def check_set(self, key, *values):
+        return [value in self.sets.get(key, ()) for value in values]
+
+    async def load_set(self, key, generation_key, generation, members, ttl):
+        if str(self.generations.get(generation_key, 0)) != generation:
+            return False
+        self.sets[key] = set(members)
+        return True
+
+    async def update_set(self, key, generation_key, command, members, ttl):
+        self.generations[generation_key] = self.generations.get(generation_key, 0) + 1
+        if key in self.sets:
+            if command == "SADD":
+                self.sets[key].update(members)
+            else:
+                self.sets[key].difference_update(members)
+
+
+@pytest.mark.asyncio
+async def test_membership_cache_loads_once_and_applies_updates():
+    from app.services.membership_cache import MembershipCache
+
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return [1, 2]
+
+    for local_size in (0, 16):
+        loads.clear()
+        cache = MembershipCache(local_size=local_size)
+        cache.redis_service = FakeSetRedisService()
+        assert await cache.is_member(7, 1, loader)
+        assert not await cache.is_member(7, 3, loader)
+        await cache.add_members(7, [3])
+        await cache.remove_members(7, [1])
+        assert await cache.is_member(7, 3, loader)
+        assert not await cache.is_member(7, 1, loader)
+        assert len(loads) == 1
+
+
+@pytest.mark.asyncio
+async def test_membership_cache_discards_load_raced_by_removal():
+    from app.services.membership_cache import MembershipCache
+
+    cache = MembershipCache(local_size=0)
+    cache.redis_service = FakeSetRedisService()
+
+    async def stale_loader():
+        await cache.remove_members(7, [1])
+        return [1, 2]
+
+    assert await cache.is_member(7, 1, stale_loader)
+
+    async def loader():
+        return [2]
+
+    assert not await cache.is_member(7, 1, loader)
+
+
+@pytest.mark.asyncio
+async def test_membership_cache_loads_once_when_store_fails():
+    from app.services.membership_cache import MembershipCache
+
+    class FailingStoreRedisService(FakeSetRedisService):
+        async def load_set(self, key, generation_key, generation, members, ttl):
+            raise RuntimeError("too many results to unpack")
+
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return [1, 2]
+
+    cache = MembershipCache(local_size=0)
+    cache.redis_service = FailingStoreRedisService()
+    assert await cache.is_member(7, 1, loader)
+    assert len(loads) == 1
@@ -38,10 +38,181 @@ async def test_get_message_history(db_session: AsyncSession, users, async_client
         await message_service.send_message(message_data, user1.id, str(uuid.uuid4()))
 
     response = await async_client.get(
-        f"/history/{chat.id}?limit=2&offset=0",
+        f"/history/{chat.id}?limit=2",
         headers={"Authorization": f"Bearer {token}"}
     )
     assert response.status_code == 200
     history = response.json()
-    assert len(history) == 2
-    assert history[0]["text"] == "Msg 0"
\ No newline at end of file
+    assert [msg["text"] for msg in history["items"]] == ["Msg 2", "Msg 1"]
+    assert history["prev_cursor"] is None
+
+    response = await async_client.get(
+        f"/history/{chat.id}?limit=2&before={history['next_cursor']}",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    older = response.json()
+    assert [msg["text"] for msg in older["items"]] == ["Msg 0"]
+    assert older["next_cursor"] is None
+
+@pytest.mark.asyncio
+async def test_ingest_pipeline_batches_concurrent_messages():
+    import asyncio
+    from app.services.message_ingest import MessageIngestPipeline
+
+    batches = []
+
+    class RecordingPipeline(MessageIngestPipeline):
+        async def _write(self, batch):
+            batches.append(len(batch))
+            for row, _, future in batch:
+                future.set_result((row["uuid"], True))
+
+    pipeline = RecordingPipeline(enabled=True, max_batch=4, max_delay=0.05)
+    await pipeline.start()
+    results = await asyncio.gather(*[
+        pipeline.submit(MessageCreate(chat_id=1, text=f"Msg {i}"), 1, f"uuid-{i}")
+        for i in range(10)
+    ])
+    await pipeline.stop()
+
+    assert results == [(f"uuid-{i}", True) for i in range(10)]
+    assert batches == [4, 4, 2]
+
+
+@pytest.mark.asyncio
+async def test_export_streams_ndjson_in_chunks():
+    import json
+    from datetime import datetime
+
+    class FakeRepository:
+        async def stream_by_chat_id(self, chat_id, chunk_size):
+            rows = [
+                {"id": i, "chat_id": chat_id, "sender_id": 1, "text": f"Msg {i}",
+                 "timestamp": datetime(2024, 1, 1), "is_read": False}
+                for i in range(5)
+            ]
+            for start in range(0, len(rows), chunk_size):
+                yield rows[start:start + chunk_size]
+
+    message_service = MessageService.__new__(MessageService)
+    message_service.message_repo = FakeRepository()
+    chunks = [chunk async for chunk in message_service.export_chat_history(1, chunk_size=2)]
+
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line)["text"] for line in lines] == [f"Msg {i}" for i in range(5)]
+
+
+@pytest.mark.asyncio
+async def test_search_returns_ranked_page_with_cursor():
+    from datetime import datetime
+
+    calls = []
+
+    class FakeRepository:
+        async def search(self, user_id, query, limit, chat_id=None, after_rank=None, after_id=None):
+            calls.append((after_rank, after_id))
+            return [
+                {"id": 10 - i, "chat_id": 1, "sender_id": 1, "text": "hello", "timestamp": datetime(2024, 1, 1),
+                 "is_read": False, "rank": 0.5, "snippet": "<mark>hello</mark>"}
+                for i in range(limit)
+            ]
+
+    message_service = MessageService.__new__(MessageService)
+    message_service.message_repo = FakeRepository()
+    page = await message_service.search_messages(1, "hello", limit=2)
+
+    assert [item.id for item in page.items] == [10, 9]
+    assert page.items[0].snippet == "<mark>hello</mark>"
+    await message_service.search_messages(1, "hello", limit=2, cursor=page.next_cursor)
+    assert calls == [(None, None), (0.5, 9)]
+
+
+@pytest.mark.asyncio
+async def test_uuid_reused_by_another_sender_is_rejected():
+    from datetime import datetime
+    from types import SimpleNamespace
+    from fastapi import HTTPException
+    from app.repositories.message_repository import MessageRepository
+
+    stored = SimpleNamespace(id=1, chat_id=1, sender_id=1, text="Secret", timestamp=datetime(2024, 1, 1), is_read=False)
+
+    class FakeRepository:
+        is_retry_of = staticmethod(MessageRepository.is_retry_of)
+
+        async def create_or_get(self, row):
+            return stored, False
+
+    message_service = MessageService.__new__(MessageService)
+    message_service.message_repo = FakeRepository()
+
+    message, created = await message_service.store_message(
+        MessageCreate(chat_id=1, text="Secret"), 1, "uuid-1", chat_verified=True
+    )
+    assert (message.id, created) == (1, False)
+    with pytest.raises(HTTPException) as error:
+        await message_service.store_message(MessageCreate(chat_id=2, text="Hi"), 2, "uuid-1", chat_verified=True)
+    assert error.value.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_ingest_pipeline_isolates_rejected_rows():
+    import asyncio
+    from types import SimpleNamespace
+    from datetime import datetime
+    from fastapi import HTTPException
+    from sqlalchemy.exc import DBAPIError
+    from app.services.message_ingest import MessageIngestPipeline
+
+    batches = []
+
+    class FailingPipeline(MessageIngestPipeline):
+        async def _write_batch(self, batch):
+            batches.append(len(batch))
+            if any(row["text"] == "bad" for row, _, _ in batch):
+                raise DBAPIError("INSERT", {}, Exception("rejected"))
+            return [
+                (row, future, SimpleNamespace(id=i, chat_id=row["chat_id"], sender_id=row["sender_id"],
+                                              text=row["text"], timestamp=datetime(2024, 1, 1), is_read=False), True)
+                for i, (row, _, future) in enumerate(batch)
+            ]
+
+    pipeline = FailingPipeline(enabled=True, max_batch=10, max_delay=0.05)
+    await pipeline.start()
+    with pytest.raises(HTTPException) as error:
+        await pipeline.submit(MessageCreate(chat_id=1, text="x" * 2001), 1, "uuid-long")
+    assert error.value.status_code == 400
+
+    submissions = [
+        asyncio.ensure_future(pipeline.submit(MessageCreate(chat_id=1, text=text), 1, f"uuid-{i}"))
+        for i, text in enumerate(["ok", "bad", "ok"])
+    ]
+    await asyncio.sleep(0)
+    await pipeline.stop()
+    results = await asyncio.gather(*submissions, return_exceptions=True)
+
+    assert batches == [3, 1, 1, 1]
+    assert [result[0].text for result in (results[0], results[2])] == ["ok", "ok"]
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 500
+
+
+def test_forged_cursor_is_rejected():
+    from fastapi import HTTPException
+    from app.services.pagination import encode_cursor, decode_cursor
+
+    assert decode_cursor(encode_cursor("2024-01-01T00:00:00", 10), str, int) == ["2024-01-01T00:00:00", 10]
+    assert decode_cursor(encode_cursor(0.5, 10), float, int) == [0.5, 10]
+    assert decode_cursor(encode_cursor(1, 10), float, int) == [1.0, 10]
+    for values, types in [
+        (("abc",), (int,)),
+        ((True,), (int,)),
+        ((2 ** 40,), (int,)),
+        (({"x": 1}, None), (str, int)),
+        (("2024-01-01T00:00:00", "7"), (str, int)),
+        (("1e3", 7), (float, int)),
+        ((float("inf"), 7), (float, int)),
+    ]:
+        with pytest.raises(HTTPException) as error:
+            decode_cursor(encode_cursor(*values), *types)
+        assert error.value.status_code == 400
@@ -12,4 +12,85 @@ async def test_create_user_with_role(db_session):
     admin = await user_service.create_user(
         UserCreate(name="Admin User", email="admin2@test.com", password="password", role="admin")
     )
-    assert admin.role == "admin"
\ No newline at end of file
+    assert admin.role == "admin"
+
+@pytest.mark.asyncio
+async def test_principal_cache_serves_repeated_lookups_from_memory():
+    from app.services.principal_cache import Principal, PrincipalCache
+    from app.schemas.user import UserRole
+
+    cache = PrincipalCache(max_size=10, ttl=60)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return Principal(id=1, role=UserRole.ADMIN)
+
+    assert (await cache.get(1, loader)).role == UserRole.ADMIN
+    assert (await cache.get(1, loader)).role == UserRole.ADMIN
+    assert len(loads) == 1
+
+    cache.ttl = 0
+    cache.entries.clear()
+    await cache.get(1, loader)
+    await cache.get(1, loader)
+    assert len(loads) == 3
+
+    async def missing():
+        return None
+
+    assert await cache.get(2, missing) is None
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_keeps_event_loop_responsive():
+    import asyncio
+    import time
+    from fastapi import HTTPException
+    from app.services.password_hasher import PasswordHasher
+
+    class SlowContext:
+        def hash(self, password):
+            time.sleep(0.2)
+            return f"hashed:{password}"
+
+        def verify_and_update(self, password, hashed):
+            return hashed == f"hashed:{password}", "rehashed"
+
+    hasher = PasswordHasher(context=SlowContext(), workers=1, max_pending=1)
+    started = time.monotonic()
+    hashing = asyncio.create_task(hasher.hash("password"))
+    await asyncio.sleep(0.01)
+    assert time.monotonic() - started < 0.1
+
+    with pytest.raises(HTTPException) as error:
+        await hasher.hash("other")
+    assert error.value.status_code == 503
+
+    assert await hashing == "hashed:password"
+    assert await hasher.verify_and_update("password", "hashed:password") == (True, "rehashed")
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_role_check_reads_current_role_not_cached_principal(monkeypatch):
+    from types import SimpleNamespace
+    from app.services import user_service as user_service_module
+    from app.services.principal_cache import Principal, PrincipalCache
+    from app.services.user_service import UserService
+    from app.schemas.user import UserRole
+
+    cache = PrincipalCache(max_size=10, ttl=60)
+    monkeypatch.setattr(user_service_module, "principal_cache", cache)
+    stored = SimpleNamespace(id=1, role=UserRole.ADMIN)
+
+    class FakeRepository:
+        async def get_by_id(self, user_id):
+            return stored
+
+    user_service = UserService.__new__(UserService)
+    user_service.user_repo = FakeRepository()
+
+    assert (await user_service.get_principal(1)) == Principal(id=1, role=UserRole.ADMIN)
+    stored.role = UserRole.USER
+    assert not await user_service.check_user_role(1, UserRole.ADMIN)
@@ -0,0 +1,346 @@
+import pytest
+import asyncio
+import json
+from prometheus_client import REGISTRY
+from app.services.connection_manager import Connection, OVERFLOW_DISCONNECT, OVERFLOW_DROP_OLDEST
+
+
+class SlowWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+
+    async def send_text(self, frame):
+        await self.release.wait()
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code=1000, reason=None):
+        self.closed_with = code
+
+
+@pytest.mark.asyncio
+async def test_send_does_not_wait_for_slow_socket():
+    websocket = SlowWebSocket()
+    connection = Connection(websocket, max_queue_size=2, overflow_policy=OVERFLOW_DROP_OLDEST)
+    connection.start()
+
+    assert connection.send_json({"n": 0})
+    await asyncio.sleep(0)
+    for i in range(1, 5):
+        assert connection.send_json({"n": i})
+
+    websocket.release.set()
+    await asyncio.sleep(0.01)
+    assert websocket.sent == [{"n": 0}, {"n": 3}, {"n": 4}]
+    connection.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_overflow_disconnects_slow_consumer():
+    websocket = SlowWebSocket()
+    connection = Connection(websocket, max_queue_size=1, overflow_policy=OVERFLOW_DISCONNECT)
+    connection.start()
+
+    assert connection.send_json({"n": 0})
+    await asyncio.sleep(0)
+    assert connection.send_json({"n": 1})
+    slow_before = REGISTRY.get_sample_value("websocket_slow_consumers_total")
+    assert not connection.send_json({"n": 2})
+    assert not connection.send_json({"n": 3})
+    assert REGISTRY.get_sample_value("websocket_slow_consumers_total") - slow_before == 1
+    await connection.close_task
+    assert websocket.closed_with == 1013
+    assert connection.closed
+
+
+@pytest.mark.asyncio
+async def test_broadcast_frame_is_serialized_once():
+    from datetime import datetime
+    from app.schemas.message import MessageEvent, MessageResponse
+    from app.services.connection_manager import ConnectionManager
+
+    manager = ConnectionManager()
+    connections = [Connection(SlowWebSocket()) for _ in range(3)]
+    manager.chat_connections[1] = set(connections)
+
+    frame = MessageEvent(message=MessageResponse(
+        id=1, chat_id=1, sender_id=1, text="Hello!", timestamp=datetime.utcnow(), is_read=False
+    )).model_dump_json()
+    manager.deliver(1, frame)
+
+    queued = [connection.queue.get_nowait() for connection in connections]
+    assert all(item is frame for item in queued)
+    assert json.loads(frame)["type"] == "message"
+
+
+class FakePubSub:
+    def __init__(self):
+        self.channels = set()
+
+    async def subscribe(self, channel):
+        self.channels.add(channel)
+
+    async def unsubscribe(self, channel):
+        self.channels.discard(channel)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        await asyncio.sleep(timeout)
+
+
+@pytest.mark.asyncio
+async def test_multiplexed_connection_is_indexed_by_user_and_chat():
+    from app.services.connection_manager import ConnectionManager
+
+    manager = ConnectionManager()
+    manager.pubsub = FakePubSub()
+    connection = manager.register(SlowWebSocket(), user_id=7)
+    await manager.subscribe(connection, 1)
+    await manager.subscribe(connection, 2)
+
+    assert manager.user_connections[7] == {connection}
+    assert connection in manager.chat_connections[1]
+    assert manager.pubsub.channels == {"chat:1", "chat:2"}
+
+    await manager.unsubscribe(connection, 1)
+    assert 1 not in manager.chat_connections
+    assert connection.chat_ids == {2}
+
+    await manager.disconnect(connection)
+    assert manager.chat_connections == {}
+    assert manager.user_connections == {}
+    assert manager.pubsub.channels == set()
+
+
+def test_read_receipts_are_coalesced_per_user_and_chat():
+    from app.services.read_receipt_service import ReadReceiptBuffer
+
+    buffer = ReadReceiptBuffer()
+    for message_id in [3, 10, 7, 200, 150]:
+        buffer.mark_read_up_to(1, 5, message_id)
+    buffer.mark_read_up_to(2, 5, 4)
+
+    assert buffer.pending == {(1, 5): 200, (2, 5): 4}
+
+
+@pytest.mark.asyncio
+async def test_membership_removal_revokes_cached_chat_access():
+    from app.services.connection_manager import ConnectionManager, MEMBERSHIP_REMOVED
+
+    manager = ConnectionManager()
+    manager.pubsub = FakePubSub()
+    multiplexed = manager.register(SlowWebSocket(), user_id=7)
+    await manager.subscribe(multiplexed, 1)
+    await manager.subscribe(multiplexed, 2)
+    legacy_socket = SlowWebSocket()
+    legacy = await manager.connect(1, legacy_socket, user_id=7)
+
+    await manager.apply_membership_change(1, 7, MEMBERSHIP_REMOVED)
+
+    assert multiplexed.chat_ids == {2}
+    assert json.loads(multiplexed.queue.get_nowait()) == {"type": "unsubscribed", "chat_id": 1, "reason": "removed"}
+    assert legacy.closed
+    assert legacy_socket.closed_with == 1008
+    assert 1 not in manager.chat_connections
+    multiplexed.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_resume_replays_missed_events_before_live_feed():
+    from app.services.connection_manager import ConnectionManager, with_event_id
+
+    manager = ConnectionManager()
+    manager.pubsub = FakePubSub()
+    stream = [("100-0", '{"type":"message","n":1}'), ("101-0", '{"type":"message","n":2}')]
+
+    class FakeRedisService:
+        async def first_event_id(self, key):
+            return "99-0"
+
+        async def read_events(self, key, after_id, count):
+            manager.deliver(1, with_event_id('{"type":"message","n":2}', "101-0"))
+            manager.deliver(1, with_event_id('{"type":"message","n":3}', "102-0"))
+            return stream
+
+    manager.redis_service = FakeRedisService()
+    connection = manager.register(SlowWebSocket(), user_id=7)
+    await manager.subscribe(connection, 1, last_seen_id="99-0")
+
+    frames = [json.loads(connection.queue.get_nowait()) for _ in range(connection.queue.qsize())]
+    assert [(frame["event_id"], frame["n"]) for frame in frames] == [("100-0", 1), ("101-0", 2), ("102-0", 3)]
+    assert connection.replaying == {}
+    connection.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_resume_past_buffer_requires_resync():
+    from app.services.connection_manager import ConnectionManager
+
+    manager = ConnectionManager()
+    manager.pubsub = FakePubSub()
+
+    class FakeRedisService:
+        async def first_event_id(self, key):
+            return "500-0"
+
+    manager.redis_service = FakeRedisService()
+    connection = manager.register(SlowWebSocket(), user_id=7)
+    await manager.subscribe(connection, 1, last_seen_id="10-0")
+
+    assert json.loads(connection.queue.get_nowait()) == {"type": "resync_required", "chat_id": 1}
+    connection.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_frame_rate_limiter_applies_connection_and_user_buckets():
+    from app.services.frame_limiter import FrameRateLimiter, FrameRateRule
+
+    rule = FrameRateRule("message", connection_rate=1, connection_burst=2, user_rate=1, user_burst=3)
+    limiter = FrameRateLimiter(rules={"message": rule}, use_redis=False)
+    first, second = Connection(SlowWebSocket()), Connection(SlowWebSocket())
+
+    assert await limiter.acquire(first, 7, "message") == 0
+    assert await limiter.acquire(first, 7, "message") == 0
+    assert await limiter.acquire(first, 7, "message") > 0
+    assert await limiter.acquire(second, 7, "message") == 0
+    assert await limiter.acquire(second, 7, "message") > 0
+    assert await limiter.acquire(second, 8, "message") == 0
+    assert await limiter.acquire(second, 7, "subscribe") == 0
+
+
+def test_admission_control_refuses_over_limits():
+    from app.services.admission_controller import AdmissionController
+
+    controller = AdmissionController(max_connections=2, max_lag=0.1)
+    assert controller.reject_reason(1) is None
+    assert controller.reject_reason(2) == "connections"
+    controller.lag = 0.5
+    assert controller.reject_reason(0) == "loop_lag"
+
+
+@pytest.mark.asyncio
+async def test_read_receipt_flush_drops_only_rejected_watermarks(monkeypatch):
+    from contextlib import asynccontextmanager
+    from sqlalchemy.exc import DBAPIError
+    from app.services import read_receipt_service
+    from app.services.read_receipt_service import ReadReceiptBuffer
+
+    written, published = [], []
+
+    @asynccontextmanager
+    async def fake_session():
+        yield None
+
+    class FakeChatRepository:
+        def __init__(self, session):
+            pass
+
+        async def get_last_message_ids(self, chat_ids):
+            return {1: 100, 2: 100, 3: 100}
+
+    class FakeReadStateRepository:
+        def __init__(self, session):
+            pass
+
+        async def upsert_watermarks(self, watermarks):
+            if any(watermark["user_id"] == 13 for watermark in watermarks):
+                raise DBAPIError("INSERT", {}, Exception("rejected"))
+            written.extend(watermarks)
+
+    async def fake_publish(chat_id, frame):
+        published.append(chat_id)
+
+    monkeypatch.setattr(read_receipt_service, "async_session", fake_session)
+    monkeypatch.setattr(read_receipt_service, "ChatRepository", FakeChatRepository)
+    monkeypatch.setattr(read_receipt_service, "ReadStateRepository", FakeReadStateRepository)
+    monkeypatch.setattr(read_receipt_service.connection_manager, "publish", fake_publish)
+
+    buffer = ReadReceiptBuffer()
+    buffer.mark_read_up_to(1, 5, 500)
+    buffer.mark_read_up_to(2, 13, 7)
+    buffer.mark_read_up_to(3, 6, 8)
+    buffer.mark_read_up_to(9, 6, 8)
+    await buffer.flush()
+
+    assert sorted((w["chat_id"], w["user_id"], w["last_read_message_id"]) for w in written) == [(1, 5, 100), (3, 6, 8)]
+    assert sorted(published) == [1, 3]
+    assert buffer.pending == {}
+
+
+@pytest.mark.asyncio
+async def test_resume_reads_replay_buffer_page_by_page(monkeypatch):
+    from app.services import connection_manager as connection_manager_module
+    from app.services.connection_manager import ConnectionManager, parse_event_id
+
+    monkeypatch.setattr(connection_manager_module, "REPLAY_BUFFER_SIZE", 2)
+    manager = ConnectionManager()
+    manager.pubsub = FakePubSub()
+    stream = [(f"{100 + n}-0", f'{{"type":"message","n":{n}}}') for n in range(5)]
+    reads = []
+
+    class FakeRedisService:
+        async def first_event_id(self, key):
+            return "99-0"
+
+        async def read_events(self, key, after_id, count):
+            reads.append(after_id)
+            after = parse_event_id(after_id)
+            return [entry for entry in stream if parse_event_id(entry[0]) > after][:count]
+
+    manager.redis_service = FakeRedisService()
+    connection = manager.register(SlowWebSocket(), user_id=7)
+    await manager.subscribe(connection, 1, last_seen_id="99-0")
+
+    frames = [json.loads(connection.queue.get_nowait()) for _ in range(connection.queue.qsize())]
+    assert [frame["n"] for frame in frames] == [0, 1, 2, 3, 4]
+    assert reads == ["99-0", "101-0", "103-0"]
+    connection.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_malformed_message_frame_gets_error_frame():
+    from app.services.websocket_service import WebSocketService
+
+    websocket = SlowWebSocket()
+    websocket.release.set()
+    connection = Connection(websocket)
+    connection.start()
+    service = WebSocketService(None)
+
+    await service.handle_message(connection, 1, 7, {"type": "message", "text": {"nested": True}, "uuid": "u-1"})
+    await service.handle_message(connection, 1, 7, {"type": "message", "text": ["a"], "uuid": "u-2"})
+    await asyncio.sleep(0.01)
+
+    assert websocket.sent == [
+        {"type": "error", "chat_id": 1, "detail": "Invalid message"},
+        {"type": "error", "chat_id": 1, "detail": "Invalid message"}
+    ]
+    assert not connection.closed
+    connection.writer_task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_malformed_frame_is_rejected_before_rate_limiter(monkeypatch):
+    from app.services import websocket_service
+    from app.services.websocket_service import WebSocketService
+
+    async def acquire(connection, user_id, frame_type):
+        raise AssertionError("malformed frame reached the rate limiter")
+
+    monkeypatch.setattr(websocket_service.frame_rate_limiter, "acquire", acquire)
+    websocket = SlowWebSocket()
+    websocket.release.set()
+    connection = Connection(websocket)
+    connection.chat_ids.add(1)
+    connection.start()
+    service = WebSocketService(None)
+    rejected_before = REGISTRY.get_sample_value("websocket_invalid_frames_total", {"reason": "frame"}) or 0
+
+    for frame in (["message"], "message", {"type": ["message"]}, {"text": "no type"}):
+        await service.handle_frame(connection, 1, 7, frame)
+    await asyncio.sleep(0.01)
+
+    assert websocket.sent == [{"type": "error", "detail": "Invalid frame"}] * 4
+    assert REGISTRY.get_sample_value("websocket_invalid_frames_total", {"reason": "frame"}) - rejected_before == 4
+    assert not connection.closed
+    connection.writer_task.cancel()